@@ -0,0 +1,127 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from media_store.storage import hash_file
+from .models import VisualUpload, VisualUploadChunk
+
+# big visuals (mostly videos) are uploaded in chunks through VisualUploadChunkView instead of one multipart body.
+# every chunk is streamed straight to its offset in a temporary file while it is hashed, so neither a chunk nor
+# the assembled file is ever held in memory, and a dropped connection only costs the chunk that was in flight.
+READ_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    pass
+
+
+class AssembledUpload(File):
+    # lets ContentAddressedStorage move the assembled file into place instead of copying it
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def get_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+
+
+def get_max_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+
+
+def get_upload_directory():
+    directory = getattr(settings, 'CHUNKED_UPLOAD_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'siteapi-chunked-uploads')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def get_upload_path(upload):
+    return os.path.join(get_upload_directory(), str(upload.pk))
+
+
+def write_chunk(upload, index, stream, checksum):
+    """
+    Writes chunk `index` of `upload` from `stream` and records it. `checksum` is the sha256 hex digest the client
+    computed for the chunk. Sending a chunk again (e.g. after a timeout) just overwrites it.
+
+    Raises ChunkError if the index is out of range, the chunk isn't exactly as long as it has to be or the checksum
+    doesn't match. Nothing is recorded in that case and the chunk has to be sent again.
+    """
+    if not 0 <= index < upload.chunk_count:
+        raise ChunkError("chunk index must be between 0 and %s" % (upload.chunk_count - 1))
+    if not checksum:
+        raise ChunkError("the chunk's sha256 is required")
+    length = upload.get_chunk_length(index)
+    offset = index * upload.chunk_size
+
+    hasher = hashlib.sha256()
+    written = 0
+    extra = b''
+    fd = os.open(get_upload_path(upload), os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        while written < length:
+            piece = stream.read(min(READ_SIZE, length - written)) if stream is not None else b''
+            if not piece:
+                break
+            os.pwrite(fd, piece, offset + written)
+            hasher.update(piece)
+            written += len(piece)
+        if stream is not None:
+            extra = stream.read(1)
+    finally:
+        os.close(fd)
+
+    if written != length or extra:
+        raise ChunkError("chunk %s has to be %s bytes" % (index, length))
+    if hasher.hexdigest() != checksum.lower():
+        raise ChunkError("chunk %s does not match its checksum" % index)
+
+    chunk, created = VisualUploadChunk.objects.update_or_create(
+        upload=upload, index=index, defaults={'size': written, 'checksum': checksum.lower()})
+    # keeps the upload from being purged as abandoned
+    VisualUpload.objects.filter(pk=upload.pk).update(modified=timezone.now())
+    return chunk
+
+
+def get_missing_chunks(upload):
+    received = set(upload.chunks.values_list('index', flat=True))
+    return [index for index in range(upload.chunk_count) if index not in received]
+
+
+def assemble(upload, checksum=None):
+    """
+    Returns the complete file of `upload`, ready to be handed to CommissionVisualSerializer. Raises ChunkError if
+    chunks are missing or `checksum` (the sha256 of the whole file, optional) doesn't match.
+    """
+    missing = get_missing_chunks(upload)
+    if missing:
+        raise ChunkError("chunks %s are missing" % ', '.join(str(index) for index in missing))
+    file = AssembledUpload(open(get_upload_path(upload), 'rb'), name=upload.filename)
+    # read back a piece at a time, the file never has to fit in memory
+    file.content_digest = hash_file(file)
+    if checksum and checksum.lower() != file.content_digest:
+        file.close()
+        raise ChunkError("the assembled file does not match its checksum")
+    return file
+
+
+def discard(upload):
+    # removes the temporary file, if storing the visual hasn't moved it away already
+    try:
+        os.remove(get_upload_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def purge_stale_uploads(older_than):
+    """Deletes uploads (and their temporary files) that haven't been touched since `older_than`. returns how many."""
+    stale = list(VisualUpload.objects.filter(modified__lt=older_than))
+    for upload in stale:
+        discard(upload)
+    VisualUpload.objects.filter(pk__in=[upload.pk for upload in stale]).delete()
+    return len(stale)
@@ -0,0 +1,81 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, models, transaction
+
+from .models import Commission
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedCounter:
+    """
+    Write-behind counter for an integer column.
+
+    Increments are added up in memory and written every `flush_interval` seconds by a background thread, with one
+    `UPDATE ... SET field = field + n` per distinct n instead of a read-modify-write save() per hit. Pending
+    increments are also flushed when the worker exits, so a crash loses at most one flush interval of counts.
+    Updates don't go through save(), so `modified` isn't touched and no signals fire.
+
+    A flush doesn't bump the model's generation either: a view count isn't worth throwing away every cached catalog
+    response and ETag every flush interval. Cached responses show the count as of when they were built, and pick up
+    the new one with the next real change to the catalog (or when they expire).
+    """
+
+    def __init__(self, model, field, flush_interval):
+        self.model = model
+        self.field = field
+        self.flush_interval = flush_interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def increment(self, pk, amount=1):
+        with self._lock:
+            self._pending[pk] += amount
+            if self._thread is None and self.flush_interval:
+                self._thread = threading.Thread(
+                    target=self._run, name='%s-flusher' % self.field, daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+
+        # rows that were incremented by the same amount share an UPDATE
+        by_amount = defaultdict(list)
+        for pk, amount in pending.items():
+            by_amount[amount].append(pk)
+        try:
+            with transaction.atomic():
+                for amount, pks in by_amount.items():
+                    self.model.objects.filter(pk__in=pks).update(
+                        **{self.field: models.F(self.field) + amount})
+        except Exception:
+            # nothing was written, so hand the increments back for the next flush to retry
+            with self._lock:
+                self._pending.update(pending)
+            raise
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush %s increments", self.field)
+            finally:
+                # this thread's connection would otherwise sit open between flushes
+                connection.close()
+
+
+# seconds between flushes. None or 0 disables the background thread, leaving only the flush at exit.
+view_counter = BufferedCounter(Commission, 'view_count', getattr(
+    settings, 'COMMISSION_VIEW_COUNT_FLUSH_INTERVAL', 10))
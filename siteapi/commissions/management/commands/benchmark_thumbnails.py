@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from commissions import thumbnails
+
+RESOLUTIONS = {
+    '4k': (3840, 2160),
+    '8k': (7680, 4320),
+}
+
+
+def make_test_image(path, size):
+    # a gradient with some noise on top, so the encoder has roughly photo-like work to do
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 24)
+    image = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    image.save(path, quality=90)
+    # the old pipeline made its thumbnails from the converted webp
+    image.save(os.path.splitext(path)[0] + '.webp', format='WEBP')
+
+
+def legacy_ladder(path, output_dir, maximum):
+    # what CommissionVisual.generate_thumbnails used to do: shrink one full size decode of the converted webp in
+    # place, saving each rung in turn
+    with Image.open(os.path.splitext(path)[0] + '.webp') as image:
+        for size in thumbnails.ladder_sizes(max(image.size), maximum):
+            image.thumbnail((size, size))
+            image.save(os.path.join(output_dir, 'legacy_%s.webp' % size))
+
+
+def engine_ladder(path, output_dir, maximum, processes):
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        # start the workers up front, a long lived pool wouldn't pay for this per upload
+        list(pool.map(abs, range(processes or os.cpu_count())))
+        started = time.perf_counter()
+        ladder = thumbnails.build_ladder(path, maximum)
+        thumbnails.encode_ladder(ladder, lambda size: os.path.join(
+            output_dir, 'engine_%s.webp' % size), pool=pool)
+        return time.perf_counter() - started
+
+
+def run(queue, engine, path, output_dir, maximum, processes):
+    # runs in a fresh process so that ru_maxrss only covers this one ladder
+    if engine:
+        elapsed = engine_ladder(path, output_dir, maximum, processes)
+    else:
+        started = time.perf_counter()
+        legacy_ladder(path, output_dir, maximum)
+        elapsed = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on linux. the pool has been shut down, so its workers count as children.
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
+
+
+def measure(engine, path, output_dir, maximum, processes):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run, args=(queue, engine, path, output_dir, maximum, processes))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+class Command(BaseCommand):
+    help = ("Compares the thumbnail engine against the old in place ladder on generated 4K and 8K JPEGs, "
+            "reporting wall time and peak RSS.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resolution', action='append', choices=sorted(RESOLUTIONS),
+                            help="resolutions to test, defaults to all of them")
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="runs per resolution and engine, the best wall time is reported")
+        parser.add_argument('--max-size', type=int, default=None,
+                            help="cap the ladder like THUMBNAIL_MAX_SIZE does")
+        parser.add_argument('--processes', type=int, default=None,
+                            help="encoder processes, defaults to the number of cpus")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            for resolution in options['resolution'] or sorted(RESOLUTIONS):
+                path = os.path.join(directory, '%s.jpg' % resolution)
+                # in its own process, otherwise the runs (which are started from this one) would inherit its
+                # peak rss
+                maker = multiprocessing.get_context('spawn').Process(
+                    target=make_test_image, args=(path, RESOLUTIONS[resolution]))
+                maker.start()
+                maker.join()
+                results = {}
+                for engine in (False, True):
+                    runs = [measure(engine, path, directory, options['max_size'], options['processes'])
+                            for i in range(options['repeat'])]
+                    results[engine] = (min(run[0] for run in runs), max(run[1] for run in runs),
+                                       max(run[2] for run in runs))
+
+                self.stdout.write("%s %sx%s, sizes %s" % (resolution, *RESOLUTIONS[resolution], thumbnails.ladder_sizes(
+                    max(RESOLUTIONS[resolution]), options['max_size'])))
+                for engine, label in ((False, 'legacy'), (True, 'engine')):
+                    elapsed, rss, worker_rss = results[engine]
+                    self.stdout.write("  %-7s %7.3fs  peak rss %6.1f MiB  largest worker %6.1f MiB" % (
+                        label, elapsed, rss / 1024, worker_rss / 1024))
+                self.stdout.write(self.style.SUCCESS("  %.2fx wall time, %.2fx peak rss" % (
+                    results[False][0] / results[True][0], results[False][1] / results[True][1])))
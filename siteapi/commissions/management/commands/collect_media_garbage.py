@@ -0,0 +1,110 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from commissions.chunked_uploads import purge_stale_uploads
+from commissions.models import CharacterReference, Commission, CommissionOption, CommissionOrder, CommissionVisual, CommissionVisualVariant, VisualUpload
+from goals.models import Goal
+from media_store.models import MediaBlob
+from media_store.storage import BLOB_DIRECTORY
+
+# every file field that stores media, and the directory (relative to MEDIA_ROOT) its files are uploaded to.
+# directories are scanned without descending into subdirectories. a field whose directory is None still keeps its
+# files referenced but isn't scanned: option example images uploaded before they got their own directory sit at the
+# top of MEDIA_ROOT, next to files that aren't ours to delete.
+MEDIA_FIELDS = [
+    (CommissionVisual, 'visual', 'commissions/visuals/'),
+    (CommissionVisual, 'poster', 'commissions/visuals/'),
+    (CommissionVisualVariant, 'file', 'commissions/visuals/'),
+    (Commission, 'ad_image', 'commissions/ads/'),
+    (CommissionOption, 'example_image', 'commissions/options/'),
+    (CommissionOption, 'example_image', None),
+    (CharacterReference, 'image', 'goals/images/'),
+    (CommissionOrder, 'customer_sketch', 'commissions/sketches/'),
+    (Goal, 'image', 'goals/images/'),
+]
+
+
+class Command(BaseCommand):
+    help = ("Deletes media files that no model references any more. "
+            "Meant to be run on a schedule, e.g. hourly from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help="leave files younger than this alone, they may belong to an upload still in flight")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="report what would be deleted without deleting it")
+        parser.add_argument('--upload-expiry-hours', type=int, default=24,
+                            help="chunked uploads that haven't received anything for this long are abandoned")
+
+    def get_referenced_names(self):
+        # one values_list query per field rather than loading every instance
+        referenced = set()
+        for model, field, directory in MEDIA_FIELDS:
+            referenced.update(os.path.normpath(name) for name in model.objects.values_list(field, flat=True)
+                              if name)
+        # blobs are reference counted and delete themselves. only the ones without a referenced MediaBlob row (left
+        # behind by a crash between writing the file and counting the reference, or between giving back the last
+        # reference and removing the file) are garbage. retain() rewrites the file of a row without references
+        referenced.update(os.path.normpath(name)
+                          for name in MediaBlob.objects.filter(ref_count__gt=0).values_list('name', flat=True))
+        return referenced
+
+    def get_candidates(self):
+        # (name relative to MEDIA_ROOT, DirEntry) for every file that could be garbage
+        for directory in sorted({directory for model, field, directory in MEDIA_FIELDS if directory}):
+            absolute_directory = os.path.join(settings.MEDIA_ROOT, directory)
+            if not os.path.isdir(absolute_directory):
+                continue
+            with os.scandir(absolute_directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        yield os.path.join(directory, entry.name), entry
+        # blobs are fanned out over blobs/ab/cd/
+        for root, directories, files in os.walk(os.path.join(settings.MEDIA_ROOT, BLOB_DIRECTORY)):
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        yield os.path.relpath(entry.path, settings.MEDIA_ROOT), entry
+
+    def handle(self, *args, **options):
+        referenced = self.get_referenced_names()
+        # files derived from a blob (its thumbnails) are named <blob stem>_<size> and live as long as the blob does
+        blob_stems = {os.path.splitext(name)[0] for name in referenced
+                      if name.startswith(os.path.normpath(BLOB_DIRECTORY))}
+        cutoff = time.time() - options['grace_minutes'] * 60
+        removed = 0
+        removed_bytes = 0
+
+        for name, entry in self.get_candidates():
+            name = os.path.normpath(name)
+            if name in referenced or os.path.splitext(name)[0].rsplit('_', 1)[0] in blob_stems:
+                continue
+            stat = entry.stat()
+            if stat.st_mtime > cutoff:
+                continue
+
+            self.stdout.write("%s %s (%s bytes)" % (
+                "would remove" if options['dry_run'] else "removing", entry.path, stat.st_size))
+            if not options['dry_run']:
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    self.stderr.write("Could not remove %s: %s" % (entry.path, e))
+                    continue
+            removed += 1
+            removed_bytes += stat.st_size
+
+        self.stdout.write(self.style.SUCCESS("%s %s unreferenced files (%s bytes)" % (
+            "would remove" if options['dry_run'] else "removed", removed, removed_bytes)))
+
+        expiry = timezone.now() - timedelta(hours=options['upload_expiry_hours'])
+        if options['dry_run']:
+            self.stdout.write("would purge %s abandoned chunked uploads" % VisualUpload.objects.filter(
+                modified__lt=expiry).count())
+        else:
+            self.stdout.write("purged %s abandoned chunked uploads" % purge_stale_uploads(expiry))
@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from commissions.media_queue import process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Processes pending visual uploads, including ones whose worker restarted or died mid job."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="keep polling for pending jobs instead of exiting once the queue is empty")
+        parser.add_argument('--interval', type=int, default=30,
+                            help="seconds between polls with --loop")
+        parser.add_argument('--stale-minutes', type=int, default=15,
+                            help="jobs processing for longer than this are assumed dead and retried")
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(minutes=options['stale_minutes'])
+        while True:
+            processed = process_pending_jobs(stale_after=stale_after)
+            if processed:
+                self.stdout.write("processed %s media jobs" % processed)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
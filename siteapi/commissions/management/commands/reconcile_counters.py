@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from siteapi.response_cache import bump_generation
+from commissions.models import Commission, CommissionOrder
+
+
+class Command(BaseCommand):
+    help = "Recomputes every commission's order_count from its completed orders and fixes the ones that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="report drifted counts without writing them")
+
+    def handle(self, *args, **options):
+        # one GROUP BY over the completed orders instead of a COUNT per commission
+        counts = dict(CommissionOrder.objects.filter(completed=True).order_by().values_list(
+            'commission_id').annotate(count=Count('id')).values_list('commission_id', 'count'))
+
+        drifted = []
+        for commission in Commission.objects.only('id', 'title', 'order_count'):
+            expected = counts.get(commission.id, 0)
+            if commission.order_count != expected:
+                self.stdout.write("%s: order_count %s -> %s" % (
+                    commission.title, commission.order_count, expected))
+                commission.order_count = expected
+                drifted.append(commission)
+
+        if drifted and not options['dry_run']:
+            with transaction.atomic():
+                Commission.objects.bulk_update(drifted, ['order_count'])
+            bump_generation(Commission)
+
+        self.stdout.write(self.style.SUCCESS(
+            "%s of %s commissions had a drifted order_count%s" % (
+                len(drifted), Commission.objects.count(), " (dry run)" if options['dry_run'] else "")))
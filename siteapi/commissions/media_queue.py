@@ -0,0 +1,115 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .models import CommissionVisual, MediaProcessingJob
+
+logger = logging.getLogger(__name__)
+
+# jobs live in the database and the process_media_jobs management command works through them, including anything
+# that was interrupted. in development uploads are also picked up right away by a small pool of threads inside the
+# web process. in production MEDIA_PROCESSING_WORKERS is 0: encoding is cpu heavy and shouldn't compete with
+# requests, so the command (run with --loop) is the only consumer. running both side by side is safe, since a job
+# is claimed with a conditional update before it runs, just not what production does.
+_executor = None
+
+# a job that has been started this many times without finishing (the visual crashes or hangs the processor) is
+# given up on instead of being retried forever
+MAX_ATTEMPTS = getattr(settings, 'MEDIA_PROCESSING_MAX_ATTEMPTS', 3)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(
+            settings, 'MEDIA_PROCESSING_WORKERS', 2), thread_name_prefix='media')
+    return _executor
+
+
+def enqueue(visual):
+    """
+    Queues `visual` for processing and returns its job. unless in process processing is disabled, the job is
+    handed to this process' pool once the current transaction commits.
+    """
+    job = MediaProcessingJob.objects.create(visual=visual)
+    if getattr(settings, 'MEDIA_PROCESSING_WORKERS', 2):
+        transaction.on_commit(lambda: get_executor().submit(run_job, job.pk))
+    return job
+
+
+def run_job(job_id):
+    # entry point for pool threads, which have their own database connection to clean up
+    try:
+        process_job(job_id)
+    except Exception:
+        logger.exception("Media processing job %s crashed", job_id)
+    finally:
+        connection.close()
+
+
+def set_visual_state(visual, state):
+    visual.processing_state = state
+    visual.save(update_fields=['processing_state'])
+
+
+def process_job(job_id):
+    """
+    Runs a pending job. Returns False if the job was already claimed (or deleted along with its visual).
+
+    Claiming is a conditional UPDATE, so a job handed to the pool and picked up by process_media_jobs at the same
+    time still only runs once.
+    """
+    claimed = MediaProcessingJob.objects.filter(pk=job_id, state=MediaProcessingJob.PENDING).update(
+        state=MediaProcessingJob.PROCESSING, started=timezone.now(), attempts=models.F('attempts') + 1)
+    if not claimed:
+        return False
+
+    job = MediaProcessingJob.objects.select_related(
+        'visual').filter(pk=job_id).first()
+    if job is None:
+        # the visual was deleted in the meantime
+        return False
+    visual = job.visual
+    set_visual_state(visual, CommissionVisual.PROCESSING)
+    try:
+        visual.process_upload()
+    except Exception as e:
+        logger.exception("Could not process visual %s", visual.pk)
+        job.state = MediaProcessingJob.FAILED
+        job.error = str(e)
+        set_visual_state(visual, CommissionVisual.FAILED)
+    else:
+        job.state = MediaProcessingJob.DONE
+        set_visual_state(visual, CommissionVisual.READY)
+    job.finished = timezone.now()
+    job.save(update_fields=['state', 'error', 'finished'])
+    return True
+
+
+def requeue_stale_jobs(stale_after):
+    """
+    Puts jobs that have been processing for longer than `stale_after` back to pending, or marks them (and their
+    visuals) failed once they have been started MAX_ATTEMPTS times. returns how many were put back.
+    """
+    cutoff = timezone.now() - stale_after
+    stale = MediaProcessingJob.objects.filter(state=MediaProcessingJob.PROCESSING, started__lt=cutoff)
+    for job in stale.filter(attempts__gte=MAX_ATTEMPTS).select_related('visual'):
+        job.state = MediaProcessingJob.FAILED
+        job.error = "Gave up after %s attempts that didn't finish." % job.attempts
+        job.finished = timezone.now()
+        job.save(update_fields=['state', 'error', 'finished'])
+        set_visual_state(job.visual, CommissionVisual.FAILED)
+    return stale.filter(attempts__lt=MAX_ATTEMPTS).update(state=MediaProcessingJob.PENDING)
+
+
+def process_pending_jobs(stale_after=timedelta(minutes=15)):
+    requeue_stale_jobs(stale_after)
+    processed = 0
+    for job_id in MediaProcessingJob.objects.filter(state=MediaProcessingJob.PENDING).values_list('id', flat=True):
+        if process_job(job_id):
+            processed += 1
+    return processed
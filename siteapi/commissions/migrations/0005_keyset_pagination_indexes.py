@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commissions', '0004_commission_base_price_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commissionorder',
+            index=models.Index(fields=['-created', '-id'], name='commissions_created_bdc9f9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commissionvisual',
+            index=models.Index(fields=['order', 'id'], name='commissions_order_051285_idx'),
+        ),
+    ]
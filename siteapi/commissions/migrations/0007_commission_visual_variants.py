@@ -0,0 +1,92 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:58
+
+import re
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+import django.db.models.deletion
+from PIL import Image
+
+# thumbnails used to be CommissionVisual rows named after the original with the size appended, e.g.
+# commissions/visuals/<uuid>_256.webp next to commissions/visuals/<uuid>.webp in the same group
+THUMBNAIL_NAME = re.compile(r'^(?P<base>.+)_(?P<size>\d+)(?P<ext>\.\w+)$')
+BATCH_SIZE = 500
+
+
+def thumbnail_rows_to_variants(apps, schema_editor):
+    CommissionVisual = apps.get_model('commissions', 'CommissionVisual')
+    CommissionVisualVariant = apps.get_model('commissions', 'CommissionVisualVariant')
+
+    last_id = 0
+    while True:
+        batch = list(CommissionVisual.objects.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        candidates = {}
+        for visual in batch:
+            match = THUMBNAIL_NAME.match(visual.visual.name)
+            if match:
+                candidates[visual.id] = (visual, match)
+        originals = {(original.group_identifier, original.visual.name): original.id
+                     for original in CommissionVisual.objects.filter(
+                         group_identifier__in={visual.group_identifier for visual, match in candidates.values()},
+                         visual__in={match['base'] + match['ext'] for visual, match in candidates.values()})}
+
+        variants = []
+        converted = []
+        for visual, match in candidates.values():
+            original_id = originals.get((visual.group_identifier, match['base'] + match['ext']))
+            if original_id is None:
+                # just a file name with an underscore in it
+                continue
+            converted.append(visual.id)
+            try:
+                with Image.open(default_storage.path(visual.visual.name)) as image:
+                    (width, height) = image.size
+                size = default_storage.size(visual.visual.name)
+            except (OSError, ValueError):
+                # the file is gone, so the thumbnail row was already useless
+                continue
+            variants.append(CommissionVisualVariant(
+                visual_id=original_id, file=visual.visual.name, size=int(match['size']), width=width,
+                height=height, format=match['ext'][1:].lower(), bytes=size))
+
+        CommissionVisualVariant.objects.bulk_create(variants, ignore_conflicts=True)
+        CommissionVisual.objects.filter(id__in=converted).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commissions', '0006_media_processing_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionVisualVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(max_length=250, upload_to='commissions/visuals/')),
+                ('size', models.PositiveIntegerField()),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=10)),
+                ('bytes', models.PositiveIntegerField()),
+                ('visual', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='commissions.commissionvisual')),
+            ],
+            options={
+                'ordering': ['size'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='commissionvisualvariant',
+            index=models.Index(fields=['size', 'visual'], name='commissions_size_ee3206_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='commissionvisualvariant',
+            constraint=models.UniqueConstraint(fields=('visual', 'size', 'format'), name='unique_visual_variant'),
+        ),
+        migrations.RunPython(thumbnail_rows_to_variants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:02
+
+import commissions.models
+from django.db import migrations, models
+import media_store.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commissions', '0007_commission_visual_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commissionvisual',
+            name='source_digest',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='characterreference',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=media_store.storage.ContentAddressedStorage(), upload_to=commissions.models.CharacterReference.get_file_path),
+        ),
+        migrations.AlterField(
+            model_name='commission',
+            name='ad_image',
+            field=models.ImageField(blank=True, storage=media_store.storage.ContentAddressedStorage(), upload_to=commissions.models.Commission.get_file_path),
+        ),
+        migrations.AlterField(
+            model_name='commissionvisual',
+            name='visual',
+            field=models.FileField(max_length=250, storage=media_store.storage.ContentAddressedStorage(), upload_to='commissions/visuals/'),
+        ),
+    ]
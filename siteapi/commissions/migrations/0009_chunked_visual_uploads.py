@@ -0,0 +1,69 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('commissions', '0008_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisualUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=250)),
+                ('size', models.BigIntegerField()),
+                ('chunk_size', models.IntegerField()),
+                ('state', models.CharField(choices=[('uploading', 'Uploading'), ('complete', 'Complete')], default='uploading', max_length=10)),
+                ('adult', models.BooleanField(default=False)),
+                ('abdl', models.BooleanField(default=False)),
+                ('is_video', models.BooleanField(default=False)),
+                ('order', models.IntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VisualUploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('size', models.IntegerField()),
+                ('checksum', models.CharField(max_length=64)),
+            ],
+            options={
+                'ordering': ['index'],
+            },
+        ),
+        migrations.AddField(
+            model_name='visualuploadchunk',
+            name='upload',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='commissions.visualupload'),
+        ),
+        migrations.AddField(
+            model_name='visualupload',
+            name='commission',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='commissions.commission'),
+        ),
+        migrations.AddField(
+            model_name='visualupload',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='visualupload',
+            name='visual',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='commissions.commissionvisual'),
+        ),
+        migrations.AddConstraint(
+            model_name='visualuploadchunk',
+            constraint=models.UniqueConstraint(fields=('upload', 'index'), name='unique_visual_upload_chunk'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commissions', '0009_chunked_visual_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commissionvisual',
+            name='poster',
+            field=models.FileField(blank=True, max_length=250, upload_to='commissions/visuals/'),
+        ),
+        migrations.AddField(
+            model_name='commissionvisualvariant',
+            name='duration',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='commissionvisualvariant',
+            name='frame_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
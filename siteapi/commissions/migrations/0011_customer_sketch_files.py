@@ -0,0 +1,72 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:20
+
+from django.db import migrations, models
+import media_store.storage
+
+from media_store.data_urls import DataURLError, store_image_data_url
+
+# every sketch is a data url of up to a few megabytes, so only a few rows are loaded at a time
+BATCH_SIZE = 50
+
+
+def sketch_data_urls_to_files(apps, schema_editor):
+    CommissionOrder = apps.get_model('commissions', 'CommissionOrder')
+
+    last_id = 0
+    while True:
+        batch = list(CommissionOrder.objects.filter(id__gt=last_id).exclude(customer_sketch_data__isnull=True).exclude(
+            customer_sketch_data='').order_by('id').only('id', 'customer_sketch_data')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        converted = []
+        for order in batch:
+            try:
+                (name, width, height) = store_image_data_url(order.customer_sketch_data, 'sketch.webp')
+            except DataURLError as e:
+                # couldn't have been displayed either
+                print("Dropping the unreadable sketch of order %s: %s" % (order.id, e))
+                continue
+            order.customer_sketch = name
+            order.customer_sketch_width = width
+            order.customer_sketch_height = height
+            converted.append(order)
+        CommissionOrder.objects.bulk_update(
+            converted, ['customer_sketch', 'customer_sketch_width', 'customer_sketch_height'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('media_store', '0001_initial'),
+        ('commissions', '0010_animated_visuals'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='commissionorder',
+            old_name='customer_sketch',
+            new_name='customer_sketch_data',
+        ),
+        migrations.AddField(
+            model_name='commissionorder',
+            name='customer_sketch',
+            field=models.FileField(blank=True, max_length=250, storage=media_store.storage.ContentAddressedStorage(), upload_to='commissions/sketches/'),
+        ),
+        migrations.AddField(
+            model_name='commissionorder',
+            name='customer_sketch_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='commissionorder',
+            name='customer_sketch_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(sketch_data_urls_to_files, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='commissionorder',
+            name='customer_sketch_data',
+        ),
+    ]
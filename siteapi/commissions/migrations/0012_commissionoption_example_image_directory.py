@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('commissions', '0011_customer_sketch_files'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='commissionoption',
+            name='example_image',
+            field=models.ImageField(blank=True, upload_to='commissions/options/'),
+        ),
+    ]
@@ -1,8 +1,17 @@
 import decimal
-from django.db import models
+import logging
+from django.conf import settings
+from django.db import models, transaction
+from django.dispatch import receiver
 import os
 import uuid
 from PIL import Image
+from media_store.data_urls import store_image_data_url
+from media_store.storage import blob_storage, manage_blob_fields
+from siteapi.response_cache import bump_generation
+from . import thumbnails
+
+logger = logging.getLogger(__name__)
 
 
 class CommissionCategory(models.Model):
@@ -24,7 +33,7 @@ class CommissionOption(models.Model):
 
     # an order needs 1 or more of each unique required
     required = models.CharField(max_length=100, blank=True, null=True)
-    example_image = models.ImageField(blank=True)
+    example_image = models.ImageField(upload_to='commissions/options/', blank=True)
 
     class Meta:
         # ascending by name
@@ -37,6 +46,21 @@ class CommissionOption(models.Model):
         return CommissionOption.objects.filter(exclusive_with=self.exclusive_with)
 
 
+class CommissionQuerySet(models.QuerySet):
+    def with_related(self, relations=None):
+        # preloads everything CommissionSerializer nests so serializing any number of commissions
+        # costs one query per relation instead of one query per relation per commission.
+        # relations limits the prefetches to the nested relations that were asked for (None means all of them)
+        prefetches = {
+            'options': models.Prefetch('options', queryset=CommissionOption.objects.all()),
+            'categories': models.Prefetch('categories', queryset=CommissionCategory.objects.all()),
+            'commission_visuals': models.Prefetch('commission_visuals',
+                                                  queryset=CommissionVisual.objects.prefetch_related('variants')),
+        }
+        return self.prefetch_related(*[prefetch for name, prefetch in prefetches.items()
+                                       if relations is None or name in relations])
+
+
 class Commission(models.Model):
     # done
     def get_file_path(instance, filename):
@@ -57,7 +81,8 @@ class Commission(models.Model):
     order_count = models.IntegerField(default=0)
     available = models.BooleanField(default=False)
     ad_blurb = models.TextField()
-    ad_image = models.ImageField(upload_to=get_file_path, blank=True)
+    ad_image = models.ImageField(
+        upload_to=get_file_path, storage=blob_storage, blank=True)
     categories = models.ManyToManyField(CommissionCategory)
     options = models.ManyToManyField(CommissionOption)
     # should this show as a front page item?
@@ -65,6 +90,8 @@ class Commission(models.Model):
     visible = models.BooleanField(default=True)
     base_price = models.IntegerField(default=0)
 
+    objects = CommissionQuerySet.as_manager()
+
     def toggle_featured(self):
         self.should_be_featured = not self.should_be_featured
         self.save()
@@ -78,13 +105,26 @@ class Commission(models.Model):
         self.save()
 
     def increment_view_count(self):
-        self.view_count = self.view_count + 1
-        self.save()
+        # atomic, so concurrent increments can't overwrite each other.
+        # the view count endpoint buffers increments through commissions.counters instead.
+        Commission.objects.filter(pk=self.pk).update(
+            view_count=models.F('view_count') + 1)
+        self.refresh_from_db(fields=['view_count'])
 
     def calculate_order_count(self):
+        # full recount. order_count is normally kept up to date by CommissionOrder.save,
+        # use the reconcile_counters command to repair every commission at once.
         self.order_count = CommissionOrder.objects.filter(
             commission_id=self.id).filter(completed=True).count()
-        self.save()
+        Commission.objects.filter(pk=self.pk).update(
+            order_count=self.order_count)
+
+    @staticmethod
+    def adjust_order_count(commission_id, amount):
+        # atomic, so concurrent order updates can't overwrite each other's counts
+        Commission.objects.filter(pk=commission_id).update(
+            order_count=models.F('order_count') + amount)
+        bump_generation(Commission)
 
 
 class CommissionVisual(models.Model):
@@ -95,145 +135,247 @@ class CommissionVisual(models.Model):
     commission = models.ForeignKey(
         Commission, on_delete=models.CASCADE, related_name='commission_visuals')
     # visual could be a video, gif, or an image
-    visual = models.FileField(upload_to='commissions/visuals/', max_length=250)
+    visual = models.FileField(
+        upload_to='commissions/visuals/', storage=blob_storage, max_length=250)
     adult = models.BooleanField(default=False)
     abdl = models.BooleanField(default=False)
     is_video = models.BooleanField(default=False)
     group_identifier = models.CharField(max_length=100, default=get_uuid)
     order = models.IntegerField()
+    # uploads are accepted as pending and processed in the background by commissions.media_queue
+    PENDING = "pending"
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+    PROCESSING_STATE_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (READY, "Ready"),
+        (FAILED, "Failed"),
+    ]
+    processing_state = models.CharField(
+        max_length=10, choices=PROCESSING_STATE_CHOICES, default=READY)
+    # digest of the uploaded file. a re-upload of the same content reuses the visual and variants of a ready one
+    # instead of being processed again
+    source_digest = models.CharField(max_length=64, blank=True, db_index=True)
+    # first frame of an animated visual as a still image, named after the visual like its variants
+    poster = models.FileField(
+        upload_to='commissions/visuals/', max_length=250, blank=True)
 
     # default order should be by order ascending:
     class Meta:
         ordering = ['order']
-
-    def rename_file_with_uuid(self):
-        # doesn't matter what file type it is, just rename it with a uuid
-        # using this instead of upload_to callable since it seems to interfere with the image.save() part of making thumbnails
-        # generate the uuid
-        uid = uuid.uuid4()
-        # get the file_field
-        file = self.visual
-        # get the file extension
-        ext = os.path.splitext(file.name)[1]
-        # get the original file name
-        OG_name = os.path.basename(file.path)
-        # rename the file physically on the disk to same location with modified name
-        os.rename(file.path, file.path.replace(OG_name, str(uid)+ext))
-        # set the new file to the file_field (this part only changes the path represented as text in the database)
-        self.visual = file.name.replace(OG_name, str(uid)+ext)
-        # save the model
-        self.save()
+        indexes = [
+            # keyset pagination position
+            models.Index(fields=['order', 'id']),
+        ]
+
+    def process_upload(self):
+        # everything a freshly uploaded visual goes through before it is ready to be served.
+        # uploads are stored under the digest of their content by media_store, so they don't need renaming
+        self.generate_thumbnails()
+        self.generate_poster()
+        self.convert_to_webp()
+
+    @staticmethod
+    def get_webp_name(name):
+        # the name a png, jpeg or gif gets after convert_to_webp, anything else is left as is
+        return name.replace('.png', '.webp').replace('.jpeg', '.webp').replace('.jpg', '.webp').replace(
+            '.gif', '.webp')
 
     def convert_to_webp(self):
-        # if file_field is a png or jpeg, then convert it to webp using pillow, ensuring to delete the old file.
+        # if file_field is a png, jpeg or gif, then convert it to webp using pillow, ensuring to delete the old file.
+        # animated gifs become animated webps with the same frame timing.
         # if file_field is anything else, then do nothing.
 
         # brings up a FieldFile object from the model (which is like a file object)
         file = self.visual
-        if file.name.endswith('.png') or file.name.endswith('.jpeg') or file.name.endswith('.jpg'):
-            print("----CONVERTING TO WEBP-----")
-            # open the file (with makes sure to close the resource after the operation is complete)
-            with Image.open(file) as image:
-                # save the file as a webp physically on the disk to the original path (with extension replaced)
-                image.save(file.path.replace('.png', '.webp').replace(
-                    '.jpeg', '.webp').replace('.jpg', '.webp'), format='WEBP')
-                # set the new file to the file_field (this part only changes the path represented as text in the database)
-                self.visual = file.name.replace('.png', '.webp').replace(
-                    '.jpeg', '.webp').replace('.jpg', '.webp')
-                # save the model
-                self.save()
-                # probably not needed but i'm not smart enough to know
-                image.close()
+        if file.name.endswith(('.png', '.jpeg', '.jpg', '.gif')):
+            webp_name = CommissionVisual.get_webp_name(file.name)
+            # the webp is named after the original's digest, so it only exists already if the same content was
+            # converted before. retain() converts when it doesn't, under the blob's lock
+
+            def write_webp():
+                if thumbnails.is_animated(file.path):
+                    thumbnails.convert_animation(file.path, file.storage.path(webp_name))
+                else:
+                    # open the file (with makes sure to close the resource after the operation is complete)
+                    with Image.open(file) as image:
+                        # save the file as a webp physically on the disk to the original path (with extension replaced)
+                        image.save(file.storage.path(webp_name), format='WEBP')
                 file.close()
-        self.remove_all_files_not_attached_to_model()
+            file.storage.retain(webp_name, write=write_webp)
+            # set the new file to the file_field (this part only changes the path represented as text in the database)
+            self.visual = webp_name
+            # save the model. this gives back the reference to the original
+            self.save()
 
     def generate_thumbnails(self):
-        def generate_sizes(max):
-            sizes = []
-            i = 256
-            while i < max:
-                sizes.append(i)
-                i = i * 2
-            # return sizes reversed
-            return sizes[::-1]
+        # thumbnails are written with the extension the visual ends up with after convert_to_webp, so this can run
+        # on the original upload (where JPEGs can be decoded at reduced scale) before it is converted
         file = self.visual
         ext = os.path.splitext(file.name)[1]
-        # OG_name = os.path.splitext(file)[0]
-        if str(ext).lower() in ['.png', '.jpeg', '.jpg', '.webp']:
-            print(file.path)
-            with Image.open(file.path) as image:
-                (x, y) = image.size
-                largest = x if x > y else y
-                sizes = generate_sizes(largest)
-                for s in sizes:
-                    # create a new file object with the new path
-                    new_file = file.path.replace(ext, '_'+str(s)+ext)
-                    # make sure this file doesn't already exist
-                    if os.path.exists(new_file):
-                        continue
-                    # resize the image
-                    image.thumbnail((s, s))
-                    # save the file physically on the disk to same location with modified name
-                    image.save(new_file)
-                    # set the new file to the file_field (this part only changes the path represented as text in the database)
-                    # have to use name here and not path because path is the full path to the file on the disk, and name is just the relative location of the file compared to MEDIA_ROOT
-                    new_model = CommissionVisual(
-                        group_identifier=self.group_identifier, visual=file.name.replace(ext, '_'+str(s)+ext), commission=self.commission, adult=self.adult, abdl=self.abdl, is_video=self.is_video, order=self.order)
-                    # new_model.visual = file.name.replace(ext, '_'+str(s)+ext)
-                    # save the model
-                    new_model.save()
-
-    def remove_all_files_not_attached_to_model(self):
-        # delete all files not attached to any models
-        # get directory of a file_field (might want to upgrade this and use the MEDIA_ROOT variable)
-        directory = os.path.dirname(self.visual.path)
-        all_files_in_directory = []
-
-        # put all the files in the directory in a list
-        for file in os.listdir(directory):
-            all_files_in_directory.append(file)
-        # get every model instance that exists
-        all_instances = CommissionVisual.objects.all()
-        filenames = []
-        # put every model instance's file_field basename in a list
-        for instance in all_instances:
-            filenames.append(os.path.basename(instance.visual.path))
-
-        # for each file in the directory, check if it's in the list of model instances' file_field basenames. If not, then delete it.
-        for file in all_files_in_directory:
-            if file not in filenames:
-                try:
-                    os.remove(os.path.join(directory, file))
-                except Exception as e:
-                    print(e)
-                    print("Could not remove "+str(file))
-
-    def delete(self, *args, **kwargs):
-        # delete the file
-        try:
-            os.remove(self.visual.path)
-            self.remove_all_files_not_attached_to_model()
-        except:
-            pass
-        # delete the model
-        super().delete(*args, **kwargs)
-        try:
-            os.remove(self.visual.path)
-            self.remove_all_files_not_attached_to_model()
-        except:
-            pass
+        if str(ext).lower() in ['.png', '.jpeg', '.jpg', '.webp', '.gif']:
+            name = CommissionVisual.get_webp_name(file.name)
+            thumbnail_ext = os.path.splitext(name)[1]
+
+            def get_thumbnail_name(size):
+                return name.replace(thumbnail_ext, '_'+str(size)+thumbnail_ext)
+
+            # animations are resized frame by frame and keep their timing
+            build_ladder = thumbnails.build_animated_ladder if thumbnails.is_animated(
+                file.path) else thumbnails.build_ladder
+            ladder = build_ladder(
+                file.path, getattr(settings, 'THUMBNAIL_MAX_SIZE', None))
+            # make sure these variants don't already exist
+            existing = set(self.variants.values_list('size', flat=True))
+            ladder = [(size, image) for size, image in ladder if size not in existing]
+            # encoded in parallel, then one insert for all of the rows
+            thumbnails.encode_ladder(
+                ladder, lambda size: file.storage.path(get_thumbnail_name(size)))
+            CommissionVisualVariant.objects.bulk_create([
+                CommissionVisualVariant(visual=self, file=get_thumbnail_name(size), size=size, width=image.width,
+                                        height=image.height, format=thumbnail_ext[1:].lower(),
+                                        bytes=file.storage.size(get_thumbnail_name(size)),
+                                        frame_count=len(getattr(image, 'frames', [image])),
+                                        duration=getattr(image, 'duration', 0))
+                for size, image in ladder])
+
+    def generate_poster(self):
+        # animated visuals get their first frame as a still, so pages can show it before (or instead of) playing
+        # the animation
+        file = self.visual
+        if self.poster or not file.name.endswith(('.gif', '.webp')) or not thumbnails.is_animated(file.path):
+            return
+        name = CommissionVisual.get_webp_name(file.name)
+        poster_name = name.replace('.webp', '_poster.webp')
+        if not file.storage.exists(poster_name):
+            thumbnails.save_poster(file.path, file.storage.path(poster_name))
+        self.poster = poster_name
+        self.save(update_fields=['poster'])
 
     def delete_group(self):
         # delete all files and db entries of a specific group.
-        commissionsInGroup = self.objects.filter(
+        commissionsInGroup = CommissionVisual.objects.filter(
             group_identifier=self.group_identifier)
         # for each commmission in commissionsInGroup, delete coressponding .visual.path using os.remove, if the file exists
         for commission in commissionsInGroup:
             try:
                 commission.delete()
-            except:
-                print("Could not delete commission instance")
-        self.remove_all_files_not_attached_to_model()
+            except Exception:
+                logger.exception("Could not delete visual %s", commission.pk)
+        # their files (and those of their variants) go with the last visual that references them, anything left
+        # behind is picked up by the collect_media_garbage command
+
+
+class CommissionVisualVariant(models.Model):
+    # a resized copy of a visual, made by CommissionVisual.generate_thumbnails.
+    # size is the rung of the thumbnail ladder (256, 512, 1024...), i.e. the longest side
+    visual = models.ForeignKey(
+        CommissionVisual, on_delete=models.CASCADE, related_name='variants')
+    file = models.FileField(upload_to='commissions/visuals/', max_length=250)
+    size = models.PositiveIntegerField()
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    bytes = models.PositiveIntegerField()
+    # animated variants keep every frame of the original. duration is one loop, in milliseconds
+    frame_count = models.PositiveIntegerField(default=1)
+    duration = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['size']
+        indexes = [
+            # size filters (?size=512, ?min_size=...) join from here to the visual
+            models.Index(fields=['size', 'visual']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['visual', 'size', 'format'], name='unique_visual_variant'),
+        ]
+
+
+class MediaProcessingJob(models.Model):
+    # one background processing run of an uploaded visual. see commissions.media_queue
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+    STATE_CHOICES = [
+        (PENDING, "Pending"),
+        (PROCESSING, "Processing"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    visual = models.ForeignKey(
+        CommissionVisual, on_delete=models.CASCADE, related_name='processing_jobs')
+    state = models.CharField(
+        max_length=10, choices=STATE_CHOICES, default=PENDING, db_index=True)
+    error = models.TextField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        # oldest first, the order they are worked through
+        ordering = ['created', 'id']
+
+
+class VisualUpload(models.Model):
+    # a visual being uploaded in chunks, see commissions.chunked_uploads.
+    # the fields a CommissionVisual is created with are given up front, the file is assembled from the chunks
+    UPLOADING = "uploading"
+    COMPLETE = "complete"
+    STATE_CHOICES = [
+        (UPLOADING, "Uploading"),
+        (COMPLETE, "Complete"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=250)
+    # total bytes, every chunk but the last one is chunk_size bytes
+    size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    state = models.CharField(
+        max_length=10, choices=STATE_CHOICES, default=UPLOADING)
+    commission = models.ForeignKey(Commission, on_delete=models.CASCADE)
+    adult = models.BooleanField(default=False)
+    abdl = models.BooleanField(default=False)
+    is_video = models.BooleanField(default=False)
+    order = models.IntegerField()
+    visual = models.ForeignKey(
+        CommissionVisual, on_delete=models.SET_NULL, blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def get_chunk_length(self, index):
+        # how many bytes chunk `index` has to be
+        if index < self.chunk_count - 1:
+            return self.chunk_size
+        return self.size - self.chunk_size * (self.chunk_count - 1)
+
+
+class VisualUploadChunk(models.Model):
+    # a chunk of a VisualUpload that has been written, and the sha256 it was verified against
+    upload = models.ForeignKey(
+        VisualUpload, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    size = models.IntegerField()
+    checksum = models.CharField(max_length=64)
+
+    class Meta:
+        ordering = ['index']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['upload', 'index'], name='unique_visual_upload_chunk'),
+        ]
 
 
 class CommissionStatus(models.Model):
@@ -243,6 +385,20 @@ class CommissionStatus(models.Model):
     color = models.CharField(max_length=100)
 
 
+class CommissionOrderQuerySet(models.QuerySet):
+    def with_related(self, relations=None):
+        # preloads everything CommissionOrderSerializer and AnonymousOrderSerializer nest.
+        # relations limits the prefetches to the nested relations that were asked for (None means all of them)
+        prefetches = {
+            'selected_options': models.Prefetch('selected_options', queryset=CommissionOption.objects.all()),
+            'statuses': models.Prefetch('statuses', queryset=CommissionStatus.objects.all()),
+            'character_references': models.Prefetch('character_references',
+                                                    queryset=CharacterReference.objects.all()),
+        }
+        return self.prefetch_related(*[prefetch for name, prefetch in prefetches.items()
+                                       if relations is None or name in relations])
+
+
 class CommissionOrder(models.Model):
     # done
     commission = models.ForeignKey(
@@ -275,35 +431,93 @@ class CommissionOrder(models.Model):
     extra_character_details = models.TextField(blank=True, null=True)
     commission_description = models.TextField()
     number_of_characters = models.IntegerField()
-    # this is a data url of customer's sketch.
-    customer_sketch = models.TextField(blank=True, null=True)
+    # the customer's sketch. it is sent as a data url and stored as a webp (see set_customer_sketch), so the row only
+    # holds a name and the sketch is served as a file
+    customer_sketch = models.FileField(
+        upload_to='commissions/sketches/', storage=blob_storage, max_length=250, blank=True)
+    customer_sketch_width = models.PositiveIntegerField(blank=True, null=True)
+    customer_sketch_height = models.PositiveIntegerField(blank=True, null=True)
     completed = models.BooleanField(default=False)
 
+    objects = CommissionOrderQuerySet.as_manager()
+
     class Meta:
         # descending by date
         ordering = ['-created']
+        indexes = [
+            # keyset pagination position
+            models.Index(fields=['-created', '-id']),
+        ]
 
-    def calculate_subtotal(self):
+    @staticmethod
+    def price(base_price, options, number_of_characters):
         CHARACTER_MODIFIER = decimal.Decimal(0.45)
-        # query all of the commission options belonging to the order.
-        opts = self.selected_options.all() if self.selected_options.all() else None
-        print(opts)
         # sum all of the costs of each commission option.
-        sum = 0
-        if opts is not None:
-            for opt in opts:
-                sum += opt.cost
-        # assign the sum to the subtotal property
-        self.subtotal = sum + self.commission.base_price + \
-            (self.number_of_characters-1) * CHARACTER_MODIFIER * \
-            (sum + self.commission.base_price)
+        option_total = sum(opt.cost for opt in options)
+        return option_total + base_price + \
+            (number_of_characters-1) * CHARACTER_MODIFIER * \
+            (option_total + base_price)
+
+    def set_customer_sketch(self, data_url):
+        """
+        Decodes `data_url` into blob storage as a webp and points customer_sketch at it. An empty value removes the
+        sketch. Raises media_store.data_urls.DataURLError for anything that isn't an image data url. Doesn't save.
+        """
+        if not data_url:
+            self.customer_sketch = ''
+            self.customer_sketch_width = self.customer_sketch_height = None
+            return
+        (name, width, height) = store_image_data_url(
+            data_url, 'sketch.webp', getattr(settings, 'CUSTOMER_SKETCH_MAX_SIZE', 10 * 1024 * 1024))
+        if self.customer_sketch.name == name:
+            # the same sketch again, which already holds a reference
+            blob_storage.delete(name)
+        self.customer_sketch = name
+        self.customer_sketch_width = width
+        self.customer_sketch_height = height
+
+    def calculate_subtotal(self):
+        # query all of the commission options belonging to the order (once) and assign the price to the subtotal property
+        self.subtotal = CommissionOrder.price(
+            self.commission.base_price, self.selected_options.all(), self.number_of_characters)
         # save the model
         self.save()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what was loaded so save() can tell whether the order moved in or out of its commission's order_count
+        instance._loaded_counted = {name: value for name, value in zip(field_names, values)
+                                    if name in ('commission_id', 'completed')}
+        return instance
+
     def save(self, *args, **kwargs):
-        # save the model
-        super().save(*args, **kwargs)
-        self.commission.calculate_order_count()
+        adding = self._state.adding
+        loaded = getattr(self, '_loaded_counted', {})
+        counted = {'commission_id': self.commission_id, 'completed': self.completed}
+        # fields that weren't loaded can't have changed
+        old = None if adding else dict(counted, **loaded)
+
+        with transaction.atomic():
+            if old is not None and old != counted:
+                # claim the move with a conditional update, so that two saves of the same stale instance can't both
+                # count it. if the row has moved on since it was loaded, move it from where it actually is.
+                while not CommissionOrder.objects.filter(pk=self.pk, **old).update(**counted):
+                    old = CommissionOrder.objects.filter(pk=self.pk).values('commission_id', 'completed').first()
+                    if old is None or old == counted:
+                        break
+            # save the model
+            super().save(*args, **kwargs)
+
+            # only completed orders are counted
+            was_counted_for = old['commission_id'] if old is not None and old['completed'] else None
+            now_counted_for = self.commission_id if self.completed else None
+            if was_counted_for != now_counted_for:
+                if was_counted_for is not None:
+                    Commission.adjust_order_count(was_counted_for, -1)
+                if now_counted_for is not None:
+                    Commission.adjust_order_count(now_counted_for, 1)
+        self._loaded_counted = counted
 
     def toggle_completed(self):
         self.completed = not self.completed
@@ -325,7 +539,8 @@ class CharacterReference(models.Model):
         CommissionOrder, on_delete=models.CASCADE, related_name='character_references')
     # link OR image allowed, not both.
     link = models.CharField(max_length=500, blank=True, null=True)
-    image = models.ImageField(upload_to=get_file_path,  blank=True, null=True)
+    image = models.ImageField(
+        upload_to=get_file_path, storage=blob_storage, blank=True, null=True)
     text_description = models.TextField(blank=True, null=True)
     adult = models.BooleanField()
     abdl = models.BooleanField()
@@ -333,15 +548,60 @@ class CharacterReference(models.Model):
     class Meta:
         ordering = ['id']
 
-    def delete(self, *args, **kwargs):
-        # delete the image
-        try:
-            os.remove(self.image.path)
-        except:
-            pass
-        # delete the model
-        super().delete(*args, **kwargs)
-        try:
-            os.remove(self.image.path)
-        except:
-            pass
+
+manage_blob_fields(Commission, 'ad_image')
+manage_blob_fields(CommissionVisual, 'visual')
+manage_blob_fields(CharacterReference, 'image')
+manage_blob_fields(CommissionOrder, 'customer_sketch')
+
+
+# anything the public commission catalog is built from invalidates its cached responses when it changes.
+@receiver(models.signals.post_save, sender=Commission)
+@receiver(models.signals.post_delete, sender=Commission)
+@receiver(models.signals.post_save, sender=CommissionOption)
+@receiver(models.signals.post_delete, sender=CommissionOption)
+@receiver(models.signals.post_save, sender=CommissionCategory)
+@receiver(models.signals.post_delete, sender=CommissionCategory)
+@receiver(models.signals.post_save, sender=CommissionVisual)
+@receiver(models.signals.post_delete, sender=CommissionVisual)
+def bump_catalog_generation(sender, **kwargs):
+    bump_generation(sender)
+
+
+@receiver(models.signals.post_save, sender=CommissionVisualVariant)
+@receiver(models.signals.post_delete, sender=CommissionVisualVariant)
+def bump_visual_generation(sender, **kwargs):
+    # variants are served as part of their visual
+    bump_generation(CommissionVisual)
+
+
+@receiver(models.signals.m2m_changed, sender=Commission.options.through)
+@receiver(models.signals.m2m_changed, sender=Commission.categories.through)
+def bump_commission_generation_on_m2m_change(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_generation(Commission)
+
+
+# orders aren't cached, but their ETags fold in these generations.
+@receiver(models.signals.post_save, sender=CommissionOrder)
+@receiver(models.signals.post_delete, sender=CommissionOrder)
+@receiver(models.signals.post_save, sender=CommissionStatus)
+@receiver(models.signals.post_delete, sender=CommissionStatus)
+@receiver(models.signals.post_save, sender=CharacterReference)
+@receiver(models.signals.post_delete, sender=CharacterReference)
+def bump_order_generation(sender, **kwargs):
+    bump_generation(sender)
+
+
+@receiver(models.signals.m2m_changed, sender=CommissionOrder.selected_options.through)
+@receiver(models.signals.m2m_changed, sender=CommissionOrder.statuses.through)
+def bump_order_generation_on_m2m_change(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_generation(CommissionOrder)
+
+
+@receiver(models.signals.post_delete, sender=CommissionOrder)
+def decrement_order_count_on_delete(sender, instance, **kwargs):
+    # a signal rather than delete() so queryset deletes are counted too
+    if instance.completed:
+        Commission.adjust_order_count(instance.commission_id, -1)
@@ -0,0 +1,124 @@
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on every field in `ordering` instead of just the first one.
+
+    DRF's CursorPagination filters on the first ordering field and falls back to OFFSET for rows that share
+    that value. Ordering on a unique composite key (e.g. ('-created', '-id')) and filtering on the whole
+    tuple means every page is a single indexed range scan, so page 1000 costs the same as page 1.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    position_separator = '|'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        # cursor pagination always enforces an ordering.
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        # if we have a cursor with a fixed position then filter by the whole key tuple.
+        if current_position is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(queryset.model, current_position, reverse))
+
+        # always fetch an extra item in order to determine if there is a page following on from this one.
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            # the query ordering was reversed, so put the items back in the order the user asked for.
+            self.page = list(reversed(self.page))
+
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_keyset_filter(self, model, position, reverse):
+        """
+        Builds the row-value comparison `(a, b) < (x, y)` as `a < x OR (a = x AND b < y)`, since the ORM
+        has no tuple comparison. Each field's direction comes from its ordering prefix.
+        """
+        values = position.split(self.position_separator)
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            # a tampered cursor is a bad cursor, not an error while the query is built
+            values = [model._meta.get_field(order.lstrip('-')).to_python(value)
+                      for order, value in zip(self.ordering, values)]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        keyset_filter = Q()
+        equal_so_far = Q()
+        for order, value in zip(self.ordering, values):
+            attr = order.lstrip('-')
+            # test for: (cursor reversed) XOR (field reversed)
+            lookup = '__lt' if reverse != order.startswith('-') else '__gt'
+            keyset_filter |= equal_so_far & Q(**{attr + lookup: value})
+            equal_so_far &= Q(**{attr: value})
+        return keyset_filter
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            value = getattr(instance, order.lstrip('-'))
+            values.append(value.isoformat() if hasattr(
+                value, 'isoformat') else str(value))
+        return self.position_separator.join(values)
+
+
+class CommissionOrderPagination(KeysetCursorPagination):
+    # newest orders first
+    ordering = ('-created', '-id')
+
+
+class CommissionVisualPagination(KeysetCursorPagination):
+    ordering = ('order', 'id')
+
+
+class CharacterReferencePagination(KeysetCursorPagination):
+    ordering = ('id',)
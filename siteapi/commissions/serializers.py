@@ -1,12 +1,108 @@
-import traceback
-from .models import Commission, CommissionCategory, CommissionOption, CommissionOrder, CommissionStatus, CommissionVisual, CharacterReference
+from .models import Commission, CommissionCategory, CommissionOption, CommissionOrder, CommissionStatus, CommissionVisual, CommissionVisualVariant, CharacterReference, MediaProcessingJob, VisualUpload
+from . import chunked_uploads
+from .media_queue import enqueue
+from media_store.data_urls import DataURLError
+from media_store.storage import blob_storage, hash_file
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from django.db import transaction
 from django.utils.text import slugify
 
 
+class SparseFieldsetMixin:
+    """
+    Lets GET requests trim the response with ?fields=a,b and opt into nested relations with ?expand=x,y.
+
+    Once either parameter is given, only the listed fields (every plain field if ?fields= is missing) and the
+    listed Meta.expandable_fields are serialized. With neither parameter the full representation is returned.
+    Views use trim_queryset() so that relations and columns that won't be serialized aren't fetched either.
+    """
+
+    @staticmethod
+    def parse_sparse_params(request):
+        # returns (fields, expand) as sets, or None for a parameter that wasn't supplied
+        def parse(param):
+            value = request.query_params.get(param, None)
+            if value is None:
+                return None
+            return {name.strip() for name in value.split(',') if name.strip()}
+        if request is None or request.method not in SAFE_METHODS:
+            return (None, None)
+        return (parse('fields'), parse('expand'))
+
+    @classmethod
+    def is_field_requested(cls, name, fields, expand):
+        if name in cls.Meta.expandable_fields:
+            return expand is not None and name in expand
+        return fields is None or name in fields
+
+    @classmethod
+    def trim_queryset(cls, queryset, request):
+        """drops the prefetches and deferrable columns the requested fieldset won't use. queryset must have with_related()."""
+        fields, expand = cls.parse_sparse_params(request)
+        if fields is None and expand is None:
+            return queryset
+        relations = [name for name in cls.Meta.expandable_fields
+                     if cls.is_field_requested(name, fields, expand)]
+        queryset = queryset.prefetch_related(None).with_related(relations)
+        if fields is None:
+            return queryset
+
+        model_fields = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        columns = {cls.Meta.model._meta.pk.name}
+        for name, field in cls().fields.items():
+            if not cls.is_field_requested(name, fields, expand):
+                continue
+            # method fields name the columns they read in Meta.method_field_sources
+            sources = getattr(cls.Meta, 'method_field_sources', {}).get(name, [field.source])
+            columns.update(source for source in sources if source in model_fields)
+        return queryset.only(*columns)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # only the outermost serializer is trimmed, never one nested inside another
+        parent = self.parent.parent if isinstance(
+            self.parent, serializers.ListSerializer) else self.parent
+        if parent is not None:
+            return fields
+        requested, expand = self.parse_sparse_params(self.context.get('request'))
+        if requested is None and expand is None:
+            return fields
+        return {name: field for name, field in fields.items()
+                if self.is_field_requested(name, requested, expand)}
+
+
+class CommissionVisualVariantSerializer(serializers.ModelSerializer):
+    # one entry of a visual's srcset
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CommissionVisualVariant
+        fields = [
+            'url',
+            'size',
+            'width',
+            'height',
+            'format',
+            'bytes',
+            'frame_count',
+            'duration',
+        ]
+
+    def get_url(self, obj):
+        request = self.context.get('request')
+        object_url = obj.file.url
+        return request.build_absolute_uri(object_url).replace('http://', 'https://')
+
+
 class CommissionVisualSerializer(serializers.ModelSerializer):
     # commission id is provided to relate a visual to a commission
     visual_url = serializers.SerializerMethodField()
+    # still first frame of an animated visual, null for everything else
+    poster_url = serializers.SerializerMethodField()
+    # the resized copies of the visual, smallest first
+    srcset = CommissionVisualVariantSerializer(
+        source='variants', many=True, read_only=True)
     commission = serializers.PrimaryKeyRelatedField(
         queryset=Commission.objects.all())
 
@@ -18,15 +114,21 @@ class CommissionVisualSerializer(serializers.ModelSerializer):
             'adult',
             'abdl',
             'visual_url',
+            'poster_url',
             'is_video',
             'group_identifier',
             'order',
-            'commission'
+            'commission',
+            'processing_state',
+            'source_digest',
+            'srcset',
         ]
 
         extra_kwargs = {
             'visual': {"write_only": True},
-            'visual_url': {"read_only": True}
+            'visual_url': {"read_only": True},
+            'processing_state': {"read_only": True},
+            'source_digest': {"read_only": True},
         }
 
     def get_visual_url(self, obj):
@@ -34,42 +136,97 @@ class CommissionVisualSerializer(serializers.ModelSerializer):
         object_url = obj.visual.url
         return request.build_absolute_uri(object_url).replace('http://', 'https://')
 
+    def get_poster_url(self, obj):
+        if not obj.poster:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(obj.poster.url).replace('http://', 'https://')
+
     def create(self, validated_data):
+        upload = validated_data['visual']
+        # set by media_store's upload handlers while the upload was received
+        digest = getattr(upload, 'content_digest', None) or hash_file(upload)
+        upload.content_digest = digest
+        validated_data['source_digest'] = digest
+
+        donor = CommissionVisual.objects.filter(
+            source_digest=digest, processing_state=CommissionVisual.READY).first()
+        if donor is not None:
+            # the same content was processed before, share its files rather than storing and processing it again
+            with transaction.atomic():
+                blob_storage.retain(donor.visual.name)
+                validated_data['visual'] = donor.visual.name
+                validated_data['processing_state'] = CommissionVisual.READY
+                validated_data['poster'] = donor.poster.name
+                instance = super().create(validated_data)
+                CommissionVisualVariant.objects.bulk_create([CommissionVisualVariant(
+                    visual=instance, file=variant.file.name, size=variant.size, width=variant.width,
+                    height=variant.height, format=variant.format, bytes=variant.bytes,
+                    frame_count=variant.frame_count, duration=variant.duration)
+                    for variant in donor.variants.all()])
+            return instance
+
+        # the upload is stored as is and processed (converted, thumbnailed) in the background.
+        # clients poll processing_state, or the job through MediaProcessingJobDetailView
+        validated_data['processing_state'] = CommissionVisual.PENDING
         instance = super().create(validated_data)
-        try:
-            instance.rename_file_with_uuid()
-        except Exception as e:
-            print(e)
-            instance.delete()
-            raise serializers.ValidationError(
-                "Something went wrong. Could not rename file.")
+        enqueue(instance)
+        return instance
 
-        try:
-            instance.convert_to_webp()
-        except Exception as e:
-            print(e)
-            instance.delete()
-            raise serializers.ValidationError(
-                "Something went wrong. Could not convert to webp.")
 
-        try:
-            instance.remove_all_files_not_attached_to_model()
-        except Exception as e:
-            print(e)
-            instance.delete()
-            raise serializers.ValidationError(
-                "Something went wrong. Could not remove files not attached to model.")
+class MediaProcessingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MediaProcessingJob
+        fields = [
+            'id',
+            'visual',
+            'state',
+            'error',
+            'attempts',
+            'created',
+            'started',
+            'finished',
+        ]
 
-        try:
-            instance.generate_thumbnails()
-        except Exception as e:
-            print(e)
-            print(traceback.format_exc())
-            instance.delete()
+
+class VisualUploadSerializer(serializers.ModelSerializer):
+    # a chunked upload, see commissions.chunked_uploads. clients resume by sending the missing_chunks
+    missing_chunks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = VisualUpload
+        fields = [
+            'id',
+            'filename',
+            'size',
+            'chunk_size',
+            'chunk_count',
+            'missing_chunks',
+            'state',
+            'commission',
+            'adult',
+            'abdl',
+            'is_video',
+            'order',
+            'visual',
+            'created',
+            'modified',
+        ]
+        read_only_fields = ['chunk_size', 'state', 'visual']
+
+    def get_missing_chunks(self, obj):
+        return chunked_uploads.get_missing_chunks(obj)
+
+    def validate_size(self, value):
+        if value < 1 or value > chunked_uploads.get_max_size():
             raise serializers.ValidationError(
-                "Something went wrong. Could not generate thumbnails.")
+                "size must be between 1 and %s bytes" % chunked_uploads.get_max_size())
+        return value
 
-        return instance
+    def create(self, validated_data):
+        validated_data['chunk_size'] = chunked_uploads.get_chunk_size()
+        validated_data['user'] = self.context['request'].user
+        return super().create(validated_data)
 
 
 class CommissionOptionSerializer(serializers.ModelSerializer):
@@ -117,7 +274,7 @@ class CommissionCategorySerializer(serializers.ModelSerializer):
         ]
 
 
-class CommissionSerializer(serializers.ModelSerializer):
+class CommissionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     options = CommissionOptionSerializer(many=True, read_only=True)
     commission_visuals = CommissionVisualSerializer(many=True, read_only=True)
     categories = CommissionCategorySerializer(many=True, read_only=True)
@@ -148,6 +305,8 @@ class CommissionSerializer(serializers.ModelSerializer):
             'ad_image_url',
             'base_price',
         ]
+        expandable_fields = ['options', 'categories', 'commission_visuals']
+        method_field_sources = {'ad_image_url': ['ad_image']}
         extra_kwargs = {
             "options": {"read_only": True},
             "commission_visuals": {"read_only": True},
@@ -169,9 +328,7 @@ class CommissionSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data['slug'] = slugify(validated_data['title'])
-        instance = super().create(validated_data=validated_data)
-        instance.calculate_order_count()
-        return instance
+        return super().create(validated_data=validated_data)
 
     def update(self, instance, validated_data):
         # if title was provided, then update slug
@@ -231,13 +388,25 @@ class CharacterReferenceSerializer(serializers.ModelSerializer):
         return None
 
 
-class CommissionOrderSerializer(serializers.ModelSerializer):
+def set_customer_sketch(instance, data_url):
+    # the sketch comes in as a data url and is stored as a file, see CommissionOrder.set_customer_sketch
+    try:
+        instance.set_customer_sketch(data_url)
+    except DataURLError as e:
+        raise serializers.ValidationError({'customer_sketch': [str(e)]})
+
+
+class CommissionOrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     statuses = CommissionStatusSerializer(read_only=True,  many=True)
     character_references = CharacterReferenceSerializer(
         read_only=True,  many=True)
     commission = serializers.PrimaryKeyRelatedField(queryset=Commission.objects.all())
     commission_data = CommissionSerializer(read_only=True)
     selected_options = CommissionOptionSerializer(read_only=True,  many=True)
+    # a data url going in, a url to the stored webp coming out
+    customer_sketch = serializers.CharField(
+        write_only=True, required=False, allow_blank=True, allow_null=True)
+    customer_sketch_url = serializers.SerializerMethodField()
 
     class Meta:
         model = CommissionOrder
@@ -261,30 +430,124 @@ class CommissionOrderSerializer(serializers.ModelSerializer):
             'commission_description',
             'number_of_characters',
             'customer_sketch',
+            'customer_sketch_url',
+            'customer_sketch_width',
+            'customer_sketch_height',
             'character_references',
             'completed'
         ]
+        expandable_fields = ['selected_options',
+                             'statuses', 'character_references']
+        method_field_sources = {'customer_sketch_url': ['customer_sketch']}
         extra_kwargs = {
             "selected_options": {"read_only": True},
             "statuses": {"read_only": True},
-            "character_references": {"read_only": True}
+            "character_references": {"read_only": True},
+            "customer_sketch_width": {"read_only": True},
+            "customer_sketch_height": {"read_only": True},
         }
 
+    def get_customer_sketch_url(self, obj):
+        if not obj.customer_sketch:
+            return None
+        request = self.context.get('request')
+        return request.build_absolute_uri(obj.customer_sketch.url).replace('http://', 'https://')
+
     def update(self, instance, validated_data):
+        if 'customer_sketch' in validated_data:
+            set_customer_sketch(instance, validated_data.pop('customer_sketch'))
+        # the commission's order_count is kept up to date by CommissionOrder.save
         instance = super().update(instance, validated_data)
         instance.calculate_subtotal()
-        instance.commission.calculate_order_count()
         return instance
 
+
+class NewOrderCharacterReferenceSerializer(serializers.ModelSerializer):
+    # character references sent along with a new order. images are uploaded afterwards through CharacterReferenceView
+
+    class Meta:
+        model = CharacterReference
+        fields = [
+            'character_name',
+            'link',
+            'text_description',
+            'adult',
+            'abdl',
+        ]
+        extra_kwargs = {
+            "link": {"required": False},
+            'text_description': {"required": False}
+        }
+
+
+class CommissionOrderCreateSerializer(serializers.ModelSerializer):
+    """
+    Creates an order together with its selected options and character references.
+
+    The options are fetched in one query and the subtotal is priced before the INSERT, then the order, its option
+    rows and its character references are written with one statement each inside a single transaction. The
+    response is the same as CommissionOrderSerializer's.
+    """
+    commission = serializers.PrimaryKeyRelatedField(
+        queryset=Commission.objects.all())
+    # plain ids rather than a PrimaryKeyRelatedField, which would fetch each option separately
+    selected_options = serializers.ListField(
+        child=serializers.IntegerField(), required=False, write_only=True)
+    character_references = NewOrderCharacterReferenceSerializer(
+        many=True, required=False, write_only=True)
+    customer_sketch = serializers.CharField(
+        write_only=True, required=False, allow_blank=True, allow_null=True)
+
+    class Meta:
+        model = CommissionOrder
+        fields = [
+            'commission',
+            'selected_options',
+            'customer_name',
+            'where_to_contact',
+            'contact_info',
+            'email',
+            'abdl',
+            'adult',
+            'artist_note',
+            'extra_character_details',
+            'commission_description',
+            'number_of_characters',
+            'customer_sketch',
+            'character_references',
+            'completed'
+        ]
+
+    def validate_selected_options(self, value):
+        options = CommissionOption.objects.in_bulk(value)
+        missing = [pk for pk in value if pk not in options]
+        if missing:
+            raise serializers.ValidationError(
+                "Commission options %s do not exist." % missing)
+        # drop duplicates, keeping the order they were sent in
+        return [options[pk] for pk in dict.fromkeys(value)]
+
     def create(self, validated_data):
-        instance = super().create(validated_data=validated_data)
-        instance.commission.calculate_order_count()
+        options = validated_data.pop('selected_options', [])
+        references = validated_data.pop('character_references', [])
+        validated_data['subtotal'] = CommissionOrder.price(
+            validated_data['commission'].base_price, options, validated_data['number_of_characters'])
+
+        sketch = validated_data.pop('customer_sketch', None)
+
+        with transaction.atomic():
+            instance = CommissionOrder(**validated_data)
+            set_customer_sketch(instance, sketch)
+            instance.save(force_insert=True)
+            through = CommissionOrder.selected_options.through
+            through.objects.bulk_create([through(
+                commissionorder_id=instance.id, commissionoption_id=option.id) for option in options])
+            CharacterReference.objects.bulk_create(
+                [CharacterReference(order=instance, **reference) for reference in references])
         return instance
 
-    def save(self, **kwargs):
-        instance = super().save(**kwargs)
-        instance.commission.calculate_order_count()
-        return instance
+    def to_representation(self, instance):
+        return CommissionOrderSerializer(instance, context=self.context).data
 
 
 class AnonymousCharacterReferenceSerializer(serializers.ModelSerializer):
@@ -1,3 +1,672 @@
-from django.test import TestCase
+import base64
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from customAuth.models import ScuzzyFoxContentManagerUser
+from siteapi.response_cache import get_generations
+from .counters import view_counter
+from .media_queue import MAX_ATTEMPTS, process_job, requeue_stale_jobs
+from .models import Commission, CommissionCategory, CommissionOption, CommissionOrder, CommissionVisual, MediaProcessingJob
+
+
+class CommissionQueryCountTests(TestCase):
+    """Serializing commissions should cost the same number of queries no matter how many there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        options = CommissionOption.objects.bulk_create(
+            [CommissionOption(name="option %s" % i, description="", cost=5) for i in range(3)])
+        categories = CommissionCategory.objects.bulk_create(
+            [CommissionCategory(name="category %s" % i) for i in range(2)])
+        commissions = Commission.objects.bulk_create([Commission(
+            title="commission %s" % i, slug="commission-%s" % i, short_description="", verbose_description="",
+            ad_blurb="") for i in range(500)])
+
+        Commission.options.through.objects.bulk_create([Commission.options.through(
+            commission_id=c.id, commissionoption_id=o.id) for c in commissions for o in options])
+        Commission.categories.through.objects.bulk_create([Commission.categories.through(
+            commission_id=c.id, commissioncategory_id=cat.id) for c in commissions for cat in categories])
+        CommissionVisual.objects.bulk_create([CommissionVisual(
+            commission=c, visual="commissions/visuals/%s_%s.webp" % (c.id, i), order=i)
+            for c in commissions for i in range(2)])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list_query_count_is_constant(self):
+        # etag aggregate + commissions + options + categories + visuals + visual variants
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('commissions'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 500)
+        self.assertEqual(len(response.data[0]['options']), 3)
+        self.assertEqual(len(response.data[0]['categories']), 2)
+        self.assertEqual(len(response.data[0]['commission_visuals']), 2)
+
+    def test_slug_detail_query_count(self):
+        with self.assertNumQueries(6):
+            response = self.client.get(
+                reverse('commissions-slug-detail', kwargs={'slug': 'commission-42'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'commission 42')
+
+    def test_sparse_fieldset_skips_unrequested_relations(self):
+        # etag aggregate + commissions
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('commissions') + '?fields=id,title')
+        self.assertEqual(set(response.data[0].keys()), {'id', 'title'})
+
+    def test_expand_fetches_only_requested_relations(self):
+        # etag aggregate + commissions + options
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('commissions') + '?fields=id,slug&expand=options')
+        self.assertEqual(set(response.data[0].keys()), {
+                         'id', 'slug', 'options'})
+        self.assertEqual(len(response.data[0]['options']), 3)
+
+
+class ResponseCacheTests(TestCase):
+    """Public catalog responses are served from cache until something they were built from changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.commission = Commission.objects.create(
+            title="commission", slug="commission", short_description="", verbose_description="", ad_blurb="")
+        cls.option = CommissionOption.objects.create(
+            name="option", description="", cost=5)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_repeat_get_is_served_from_cache(self):
+        self.client.get(reverse('commissions'))
+        # only the etag aggregate
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('commissions'))
+        self.assertEqual(response.data[0]['title'], 'commission')
+
+    def test_save_invalidates(self):
+        self.client.get(reverse('commissions'))
+        self.commission.title = "renamed"
+        self.commission.save()
+        response = self.client.get(reverse('commissions'))
+        self.assertEqual(response.data[0]['title'], 'renamed')
+
+    def test_m2m_change_invalidates(self):
+        self.client.get(reverse('commissions'))
+        self.commission.options.add(self.option)
+        response = self.client.get(reverse('commissions'))
+        self.assertEqual(len(response.data[0]['options']), 1)
+
+    def test_generation_is_bumped_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.commission.title = "renamed"
+            self.commission.save()
+            (during,) = get_generations([Commission])
+        # a response cached while the write was uncommitted is unreachable once it commits
+        self.assertNotEqual(get_generations([Commission]), [during])
+
+
+class ConditionalGetTests(TestCase):
+    """Revalidating GETs get a 304 without the commission being serialized."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.commission = Commission.objects.create(
+            title="commission", slug="commission", short_description="", verbose_description="", ad_blurb="")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('commissions-detail',
+                           kwargs={'pk': self.commission.pk})
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response.headers)
+        # just the aggregate
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_change_invalidates_etag(self):
+        etag = self.client.get(self.url).headers['ETag']
+        self.commission.categories.add(
+            CommissionCategory.objects.create(name="category"))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url).headers['Last-Modified']
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class BufferedViewCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.commission = Commission.objects.create(
+            title="commission", slug="commission", short_description="", verbose_description="", ad_blurb="")
+        cls.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('commissions-increment-view-count',
+                           kwargs={'pk': self.commission.pk})
+
+    def test_increments_are_buffered_until_flush(self):
+        modified = self.commission.modified
+        for _ in range(3):
+            response = self.client.put(self.url)
+            self.assertEqual(response.status_code, 202)
+        self.commission.refresh_from_db()
+        self.assertEqual(self.commission.view_count, 0)
+
+        generations = get_generations([Commission])
+        with CaptureQueriesContext(connection) as queries:
+            view_counter.flush()
+        updates = [query for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.commission.refresh_from_db()
+        self.assertEqual(self.commission.view_count, 3)
+        self.assertEqual(self.commission.modified, modified)
+        # cached catalog responses stay valid
+        self.assertEqual(get_generations([Commission]), generations)
+
+    def test_unknown_commission(self):
+        response = self.client.put(reverse('commissions-increment-view-count', kwargs={'pk': 999999}))
+        self.assertEqual(response.status_code, 404)
+
+
+class OrderCountTests(TestCase):
+    """order_count only moves when an order's completed flag actually changes."""
+
+    def setUp(self):
+        self.commission = Commission.objects.create(
+            title="commission", slug="commission", short_description="", verbose_description="", ad_blurb="")
+
+    def make_order(self, **kwargs):
+        return CommissionOrder.objects.create(
+            commission=self.commission, customer_name="customer", where_to_contact=CommissionOrder.TELEGRAM,
+            contact_info="", email="a@b.com", abdl=False, adult=False, commission_description="",
+            number_of_characters=1, **kwargs)
+
+    def assertOrderCount(self, expected):
+        self.commission.refresh_from_db()
+        self.assertEqual(self.commission.order_count, expected)
+
+    def test_completed_transitions(self):
+        order = self.make_order()
+        self.assertOrderCount(0)
+        order.toggle_completed()
+        self.assertOrderCount(1)
+        # saving again without a transition doesn't count twice
+        order = CommissionOrder.objects.get(pk=order.pk)
+        order.artist_note = "note"
+        order.save()
+        self.assertOrderCount(1)
+        order.toggle_completed()
+        self.assertOrderCount(0)
+
+    def test_stale_copies_count_once(self):
+        order = self.make_order()
+        first = CommissionOrder.objects.get(pk=order.pk)
+        second = CommissionOrder.objects.get(pk=order.pk)
+        first.toggle_completed()
+        second.toggle_completed()
+        self.assertOrderCount(1)
+        # the second copy moved the row back from where it actually was
+        first = CommissionOrder.objects.get(pk=order.pk)
+        stale = CommissionOrder.objects.get(pk=order.pk)
+        first.toggle_completed()
+        stale.completed = False
+        stale.save()
+        self.assertOrderCount(0)
+
+    def test_delete_completed_order(self):
+        self.make_order(completed=True)
+        self.make_order(completed=True)
+        self.assertOrderCount(2)
+        CommissionOrder.objects.all().delete()
+        self.assertOrderCount(0)
+
+    def test_reconcile_counters(self):
+        self.make_order(completed=True)
+        Commission.objects.update(order_count=7)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertOrderCount(1)
+
+
+class OrderCreationTests(TestCase):
+    """Creating an order costs the same number of queries however many options and references it has."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.commission = Commission.objects.create(
+            title="commission", slug="commission", short_description="", verbose_description="", ad_blurb="",
+            base_price=20)
+        cls.options = CommissionOption.objects.bulk_create(
+            [CommissionOption(name="option %s" % i, description="", cost=5) for i in range(10)])
+        cls.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_order(self, option_count, **extra):
+        data = {
+            'commission': self.commission.id,
+            'selected_options': [option.id for option in self.options[:option_count]],
+            'character_references': [{'character_name': "character %s" % i, 'link': "https://scuzzyfox.com",
+                                      'adult': False, 'abdl': False}
+                                     for i in range(option_count)],
+            'customer_name': "customer",
+            'where_to_contact': CommissionOrder.TELEGRAM,
+            'contact_info': "@customer",
+            'email': "customer@scuzzyfox.com",
+            'abdl': False,
+            'adult': False,
+            'commission_description': "description",
+            'number_of_characters': 1,
+            **extra,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('commissions-orders'), data, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response, len(queries.captured_queries)
+
+    def test_query_count_is_constant(self):
+        _, one_option_queries = self.create_order(1)
+        response, ten_option_queries = self.create_order(10)
+        self.assertEqual(one_option_queries, ten_option_queries)
+        self.assertEqual(len(response.data['selected_options']), 10)
+        self.assertEqual(len(response.data['character_references']), 10)
+        self.assertEqual(float(response.data['subtotal']), 70)
+
+    def test_unknown_option(self):
+        response = self.client.post(reverse('commissions-orders'), {
+            'commission': self.commission.id, 'selected_options': [999999]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('selected_options', response.data)
+
+    def test_sketch_is_stored_as_a_file(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        sketch = 'data:image/png;base64,' + base64.b64encode(
+            make_image_upload('sketch.png', (300, 200), 'PNG').read()).decode()
+
+        with override_settings(MEDIA_ROOT=media_root):
+            response, queries = self.create_order(1, customer_sketch=sketch)
+            # the data url isn't sent back, just where the sketch can be fetched from
+            self.assertNotIn('customer_sketch', response.data)
+            self.assertTrue(response.data['customer_sketch_url'].endswith('.webp'))
+            self.assertEqual((response.data['customer_sketch_width'], response.data['customer_sketch_height']),
+                             (300, 200))
+            order = CommissionOrder.objects.get(pk=response.data['id'])
+            with Image.open(order.customer_sketch.path) as image:
+                self.assertEqual(image.format, 'WEBP')
+
+            url = reverse('commissions-orders-detail', kwargs={'pk': order.pk})
+            response = self.client.put(url, {'customer_sketch': 'data:text/plain;base64,aGk='}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('customer_sketch', response.data)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put(url, {'customer_sketch': ''}, format='json')
+            self.assertIsNone(response.data['customer_sketch_url'])
+            self.assertFalse(os.path.exists(order.customer_sketch.path))
+
+
+def make_image_upload(name, size, format):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, format=format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class MediaProcessingTests(TestCase):
+    """Uploads are accepted as pending and processed by a job outside the request."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.commission = Commission.objects.create(
+            title="commission", slug="commission", short_description="", verbose_description="", ad_blurb="")
+        cls.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_upload_is_processed_by_job(self):
+        response = self.client.post(reverse('commissions-visuals'), {
+            'visual': make_image_upload('upload.png', (600, 400), 'PNG'),
+            'commission': self.commission.id,
+            'order': 1,
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['processing_state'], CommissionVisual.PENDING)
+        job = MediaProcessingJob.objects.get(visual_id=response.data['id'])
+
+        self.assertTrue(process_job(job.id))
+        # a job only ever runs once
+        self.assertFalse(process_job(job.id))
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, MediaProcessingJob.DONE)
+        visual = CommissionVisual.objects.get(pk=response.data['id'])
+        self.assertEqual(visual.processing_state, CommissionVisual.READY)
+        self.assertTrue(visual.visual.name.endswith('.webp'))
+        # 256 and 512 thumbnails
+        self.assertEqual([variant.size for variant in visual.variants.all()], [256, 512])
+
+        response = self.client.get(reverse('commissions-media-jobs-detail', kwargs={'pk': job.id}))
+        self.assertEqual(response.data['state'], MediaProcessingJob.DONE)
+
+    def test_stale_jobs_are_retried_up_to_max_attempts(self):
+        response = self.client.post(reverse('commissions-visuals'), {
+            'visual': make_image_upload('upload.png', (600, 400), 'PNG'), 'commission': self.commission.id,
+            'order': 1})
+        job = MediaProcessingJob.objects.get(visual_id=response.data['id'])
+        # a processor that died mid job, once and then too often
+        long_ago = timezone.now() - datetime.timedelta(hours=1)
+        MediaProcessingJob.objects.filter(pk=job.pk).update(
+            state=MediaProcessingJob.PROCESSING, started=long_ago, attempts=MAX_ATTEMPTS - 1)
+        self.assertEqual(requeue_stale_jobs(datetime.timedelta(minutes=15)), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.state, MediaProcessingJob.PENDING)
+
+        MediaProcessingJob.objects.filter(pk=job.pk).update(
+            state=MediaProcessingJob.PROCESSING, started=long_ago, attempts=MAX_ATTEMPTS)
+        self.assertEqual(requeue_stale_jobs(datetime.timedelta(minutes=15)), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.state, MediaProcessingJob.FAILED)
+        self.assertEqual(CommissionVisual.objects.get(pk=job.visual_id).processing_state, CommissionVisual.FAILED)
+
+    def test_reupload_reuses_processed_visual(self):
+        upload = make_image_upload('upload.png', (600, 400), 'PNG')
+        response = self.client.post(reverse('commissions-visuals'), {
+            'visual': upload, 'commission': self.commission.id, 'order': 1})
+        first = CommissionVisual.objects.get(pk=response.data['id'])
+        with self.captureOnCommitCallbacks(execute=True):
+            process_job(MediaProcessingJob.objects.get(visual=first).id)
+        first.refresh_from_db()
+
+        upload.seek(0)
+        response = self.client.post(reverse('commissions-visuals'), {
+            'visual': upload, 'commission': self.commission.id, 'order': 2})
+        # nothing left to do for the second one
+        self.assertEqual(response.data['processing_state'], CommissionVisual.READY)
+        second = CommissionVisual.objects.get(pk=response.data['id'])
+        self.assertFalse(MediaProcessingJob.objects.filter(visual=second).exists())
+        self.assertEqual(second.visual.name, first.visual.name)
+        self.assertEqual([variant.file.name for variant in second.variants.all()],
+                         [variant.file.name for variant in first.variants.all()])
+
+        # the shared files stay until the last visual using them is gone
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(second.visual.path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(second.visual.path))
+        self.assertEqual(os.listdir(os.path.dirname(second.visual.path)), [])
+
+    def test_animated_gif_becomes_animated_webp(self):
+        frames = [Image.new('RGB', (600, 400), color) for color in [(255, 0, 0), (0, 255, 0), (0, 0, 255)]]
+        buffer = BytesIO()
+        frames[0].save(buffer, format='GIF', save_all=True, append_images=frames[1:], duration=[100, 200, 300],
+                       loop=0)
+        response = self.client.post(reverse('commissions-visuals'), {
+            'visual': SimpleUploadedFile('clip.gif', buffer.getvalue()), 'commission': self.commission.id,
+            'order': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            process_job(MediaProcessingJob.objects.get(visual_id=response.data['id']).id)
+
+        visual = CommissionVisual.objects.get(pk=response.data['id'])
+        self.assertTrue(visual.visual.name.endswith('.webp'))
+        # the gif itself is released once converted, nothing derived from the content goes with it
+        self.assertFalse(os.path.exists(visual.visual.path.replace('.webp', '.gif')))
+        with Image.open(visual.visual.path) as image:
+            self.assertEqual(image.n_frames, 3)
+            self.assertEqual(image.info['loop'], 0)
+        for variant in visual.variants.all():
+            self.assertEqual((variant.frame_count, variant.duration), (3, 600))
+            with Image.open(variant.file.path) as image:
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.n_frames, 3)
+                self.assertEqual(max(image.size), variant.size)
+                # the third frame starts after the 100 and 200ms ones
+                image.seek(2)
+                image.load()
+                self.assertEqual(image.info['timestamp'], 300)
+        with Image.open(visual.poster.path) as image:
+            self.assertEqual((image.format, getattr(image, 'n_frames', 1), image.size), ('WEBP', 1, (600, 400)))
+            # red, give or take what lossy webp does to it
+            (red, green, blue) = image.convert('RGB').getpixel((0, 0))
+            self.assertTrue(red > 240 and green < 16 and blue < 16)
+
+        response = self.client.get(reverse('commissions-visuals'))
+        self.assertTrue(response.data['results'][0]['poster_url'].endswith('_poster.webp'))
+
+    def test_thumbnail_ladder(self):
+        os.makedirs(os.path.join(self.media_root, 'commissions/visuals'))
+        with open(os.path.join(self.media_root, 'commissions/visuals/photo.jpg'), 'wb') as file:
+            file.write(make_image_upload('photo.jpg', (1800, 1200), 'JPEG').read())
+        visual = CommissionVisual.objects.create(
+            commission=self.commission, visual='commissions/visuals/photo.jpg', order=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            visual.generate_thumbnails()
+        # every variant row goes in with one insert
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('INSERT')]), 1)
+
+        # named after the webp the original is about to become, each one sized from the rung above it
+        variants = visual.variants.all()
+        self.assertEqual([variant.file.name for variant in variants], [
+            'commissions/visuals/photo_256.webp', 'commissions/visuals/photo_512.webp',
+            'commissions/visuals/photo_1024.webp'])
+        for variant in variants:
+            with Image.open(variant.file.path) as image:
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, (variant.width, variant.height))
+                self.assertEqual(max(image.size), variant.size)
+            self.assertEqual(variant.bytes, os.path.getsize(variant.file.path))
+
+        response = self.client.get(reverse('commissions-visuals') + '?size=512')
+        self.assertEqual([result['id'] for result in response.data['results']], [visual.id])
+        self.assertEqual([variant['size'] for variant in response.data['results'][0]['srcset']], [512])
+        response = self.client.get(reverse('commissions-visuals') + '?min_size=2048')
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get(reverse('commissions-visuals') + '?size=abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('size', response.data)
+
+
+@override_settings(CHUNKED_UPLOAD_CHUNK_SIZE=1000)
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.commission = Commission.objects.create(
+            title="commission", slug="commission", short_description="", verbose_description="", ad_blurb="")
+        cls.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.upload_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, CHUNKED_UPLOAD_DIR=self.upload_dir)
+        self.settings_override.enable()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.content = make_image_upload('clip.png', (300, 200), 'PNG').read()
+        response = self.client.post(reverse('commissions-visual-uploads'), {
+            'filename': 'clip.png', 'size': len(self.content), 'commission': self.commission.id, 'order': 1})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.upload = response.data
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+    def put_chunk(self, index, data=None, checksum=None):
+        data = self.content[index * 1000:(index + 1) * 1000] if data is None else data
+        return self.client.put(
+            reverse('commissions-visual-uploads-chunk', kwargs={'pk': self.upload['id'], 'index': index}),
+            data, content_type='application/octet-stream',
+            HTTP_X_CHUNK_CHECKSUM=checksum or hashlib.sha256(data).hexdigest())
+
+    def test_chunks_in_any_order_then_finalize(self):
+        chunk_count = self.upload['chunk_count']
+        self.assertEqual(chunk_count, -(-len(self.content) // 1000))
+        for index in reversed(range(chunk_count)):
+            response = self.put_chunk(index)
+            self.assertEqual(response.status_code, 200, response.data)
+        # sending a chunk again is harmless
+        self.assertEqual(self.put_chunk(0).status_code, 200)
+
+        response = self.client.post(reverse('commissions-visual-uploads-finalize', kwargs={'pk': self.upload['id']}),
+                                    {'checksum': hashlib.sha256(self.content).hexdigest()})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['processing_state'], CommissionVisual.PENDING)
+        visual = CommissionVisual.objects.get(pk=response.data['id'])
+        # handed to the normal pipeline
+        self.assertTrue(MediaProcessingJob.objects.filter(visual=visual).exists())
+        with open(visual.visual.path, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_bad_chunks_are_rejected_and_can_be_resent(self):
+        response = self.put_chunk(0, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        response = self.put_chunk(0, data=b'too short')
+        self.assertEqual(response.status_code, 400)
+        response = self.put_chunk(self.upload['chunk_count'])
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(reverse('commissions-visual-uploads-finalize', kwargs={'pk': self.upload['id']}))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('commissions-visual-uploads-detail', kwargs={'pk': self.upload['id']}))
+        self.assertEqual(response.data['missing_chunks'], list(range(self.upload['chunk_count'])))
+
+        self.assertEqual(self.put_chunk(0).status_code, 200)
+        response = self.client.get(reverse('commissions-visual-uploads-detail', kwargs={'pk': self.upload['id']}))
+        self.assertEqual(response.data['missing_chunks'], list(range(1, self.upload['chunk_count'])))
+
+
+class MediaGarbageCollectionTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        os.makedirs(os.path.join(self.media_root, 'commissions/visuals'))
+        os.makedirs(os.path.join(self.media_root, 'goals/images'))
+        for name in ['commissions/visuals/kept.webp', 'commissions/visuals/orphan.webp', 'goals/images/orphan.png',
+                     'not-ours.txt']:
+            open(os.path.join(self.media_root, name), 'wb').close()
+        commission = Commission.objects.create(
+            title="commission", slug="commission", short_description="", verbose_description="", ad_blurb="")
+        CommissionVisual.objects.create(
+            commission=commission, visual='commissions/visuals/kept.webp', order=1)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.media_root, name))
+
+    def test_removes_only_unreferenced_files(self):
+        call_command('collect_media_garbage', grace_minutes=0, stdout=StringIO())
+        self.assertTrue(self.exists('commissions/visuals/kept.webp'))
+        self.assertFalse(self.exists('commissions/visuals/orphan.webp'))
+        self.assertFalse(self.exists('goals/images/orphan.png'))
+        # the top of MEDIA_ROOT is shared with whatever else puts files there
+        self.assertTrue(self.exists('not-ours.txt'))
+
+    def test_grace_period_and_dry_run(self):
+        call_command('collect_media_garbage', stdout=StringIO())
+        self.assertTrue(self.exists('commissions/visuals/orphan.webp'))
+        out = StringIO()
+        call_command('collect_media_garbage', grace_minutes=0, dry_run=True, stdout=out)
+        self.assertTrue(self.exists('commissions/visuals/orphan.webp'))
+        self.assertIn('would remove 2 unreferenced files', out.getvalue())
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages should cover every row exactly once, even when the leading ordering field has ties."""
+
+    @classmethod
+    def setUpTestData(cls):
+        commission = Commission.objects.create(
+            title="commission", slug="commission", short_description="", verbose_description="", ad_blurb="")
+        CommissionOrder.objects.bulk_create([CommissionOrder(
+            commission=commission, customer_name="customer %s" % i, where_to_contact=CommissionOrder.TELEGRAM,
+            contact_info="", email="a@b.com", abdl=False, adult=False, commission_description="",
+            number_of_characters=1) for i in range(25)])
+        # every order shares a timestamp so only the id can break ties
+        created = CommissionOrder.objects.first().created
+        CommissionOrder.objects.update(created=created)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_walks_every_order_once(self):
+        seen = []
+        url = reverse('commissions-orders') + '?page_size=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 10)
+            seen.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(CommissionOrder.objects.order_by(
+            '-created', '-id').values_list('id', flat=True)))
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(
+            reverse('commissions-orders') + '?page_size=100000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 25)
+        self.assertIsNone(response.data['next'])
+
+    def test_tampered_cursor(self):
+        for position in ["2026-01-01T00:00:00|abc", "yesterday|1", "1"]:
+            cursor = base64.b64encode(('p=' + position).encode()).decode()
+            response = self.client.get(reverse('commissions-orders'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
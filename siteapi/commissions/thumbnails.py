@@ -0,0 +1,177 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageSequence
+
+# the ladder starts here and doubles until it reaches the size of the original
+SMALLEST_THUMBNAIL = 256
+
+# encoding is the expensive part of building a ladder and is cpu bound, so it happens in a pool of processes.
+# they are spawned rather than forked because the pool is used from the media_queue threads.
+# every process that builds ladders gets its own pool, so it is kept small by default: a cpu_count sized pool in each
+# of several web workers would have them all fighting over the same cores. in production only process_media_jobs
+# builds ladders (see commissions.media_queue), which is where a bigger THUMBNAIL_PROCESSES makes sense.
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=getattr(settings, 'THUMBNAIL_PROCESSES', 2),
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def ladder_sizes(largest, maximum=None):
+    """Returns the thumbnail sizes for an image whose longest side is `largest`, biggest first."""
+    sizes = []
+    size = SMALLEST_THUMBNAIL
+    while size < largest and (maximum is None or size <= maximum):
+        sizes.append(size)
+        size = size * 2
+    return sizes[::-1]
+
+
+def fit(image_size, box):
+    # roughly the size Image.thumbnail produces for a square box
+    (x, y) = image_size
+    scale = box / max(x, y)
+    return (max(1, round(x * scale)), max(1, round(y * scale)))
+
+
+def build_ladder(path, maximum=None):
+    """
+    Decodes the image at `path` once and returns [(size, image), ...] for every rung of its ladder, biggest first.
+
+    JPEGs are decoded at the smallest scale that still covers the biggest rung (draft()), and every rung is
+    resized from the one above it instead of from the original.
+    """
+    with Image.open(path) as image:
+        sizes = ladder_sizes(max(image.size), maximum)
+        if not sizes:
+            return []
+        # only does anything for JPEGs
+        image.draft(image.mode, fit(image.size, sizes[0]))
+        # in place, so the full size decode is released as soon as the biggest rung exists
+        image.thumbnail((sizes[0], sizes[0]))
+        current = image.copy()
+
+    ladder = [(sizes[0], current)]
+    for size in sizes[1:]:
+        current = current.copy()
+        current.thumbnail((size, size))
+        ladder.append((size, current))
+    return ladder
+
+
+class Animation:
+    """
+    The frames of an animated visual at one size, with the timing of the original. Quacks enough like an Image
+    (width, height, save) to go through encode_ladder.
+    """
+
+    def __init__(self, frames, durations, loop):
+        self.frames = frames
+        # milliseconds each frame is shown for
+        self.durations = durations
+        self.loop = loop
+
+    @property
+    def width(self):
+        return self.frames[0].width
+
+    @property
+    def height(self):
+        return self.frames[0].height
+
+    @property
+    def duration(self):
+        return sum(self.durations)
+
+    def save(self, path, format=None):
+        self.frames[0].save(path, format=format, save_all=True, append_images=self.frames[1:],
+                            duration=self.durations, loop=self.loop)
+
+
+def is_animated(path):
+    with Image.open(path) as image:
+        return getattr(image, 'is_animated', False)
+
+
+def get_loop(image):
+    # a gif without a NETSCAPE loop extension plays once, which is loop=1 for webp (where 0 means forever)
+    return image.info.get('loop', 1)
+
+
+def get_durations(infos):
+    # gif frames carry their own duration, pillow only tells webp frames the timestamp they start at
+    durations = []
+    for index, info in enumerate(infos):
+        if 'duration' in info:
+            durations.append(info['duration'])
+        elif 'timestamp' in info and index + 1 < len(infos):
+            durations.append(infos[index + 1]['timestamp'] - info['timestamp'])
+        else:
+            durations.append(durations[-1] if durations else 100)
+    return durations
+
+
+def convert_animation(source_path, path, format='WEBP'):
+    """
+    Re-encodes the animation at `source_path` (a gif, usually) to `path`, keeping every frame's duration. The
+    frames are streamed from the decoder to the encoder one at a time, never all held at full size.
+    """
+    with Image.open(source_path) as image:
+        durations = get_durations([dict(frame.info) for frame in ImageSequence.Iterator(image)])
+        image.seek(0)
+        image.save(path, format=format, save_all=True, duration=durations, loop=get_loop(image))
+
+
+def save_poster(source_path, path, format='WEBP'):
+    # the first frame on its own, for clients that show something static until the animation is played
+    with Image.open(source_path) as image:
+        image.seek(0)
+        image.convert('RGBA').save(path, format=format)
+
+
+def build_animated_ladder(path, maximum=None):
+    """
+    Like build_ladder, for animations: returns [(size, Animation), ...], biggest first. Every frame is decoded
+    once and shrunk down the ladder before the next one is decoded, so the full size frames are never all in memory.
+    """
+    with Image.open(path) as image:
+        sizes = ladder_sizes(max(image.size), maximum)
+        if not sizes:
+            return []
+        loop = get_loop(image)
+        ladders = [[] for size in sizes]
+        infos = []
+        for frame in ImageSequence.Iterator(image):
+            infos.append(dict(frame.info))
+            # gif frames after the first are already composited onto the ones before them by pillow
+            current = frame.convert('RGBA')
+            for index, size in enumerate(sizes):
+                if index:
+                    current = current.copy()
+                current.thumbnail((size, size))
+                ladders[index].append(current)
+    durations = get_durations(infos)
+    return [(size, Animation(frames, durations, loop)) for size, frames in zip(sizes, ladders)]
+
+
+def encode(image, path, format=None):
+    # runs in a pool process
+    image.save(path, format=format)
+    return path
+
+
+def encode_ladder(ladder, path_for_size, format=None, pool=None):
+    """Writes every rung of `ladder` to path_for_size(size) in parallel and returns the paths in ladder order."""
+    if len(ladder) <= 1:
+        return [encode(image, path_for_size(size), format) for size, image in ladder]
+    pool = pool or get_pool()
+    # the biggest rung is encoded here rather than copied over to a worker
+    futures = [pool.submit(encode, image, path_for_size(size), format) for size, image in ladder[1:]]
+    (size, image) = ladder[0]
+    return [encode(image, path_for_size(size), format)] + [future.result() for future in futures]
@@ -1,5 +1,5 @@
 from django.urls import path, re_path
-from .views import CommissionView, CommissionDetailView, CommissionOrderView, CommissionOrderDetailView, CommissionCategoryView, CommissionCategoryDetailView, CommissionOptionDetailView, CommissionOptionView, CommissionStatusView, CommissionVisualView, CharacterReferenceView, CommissionStatusDetailView, CommissionVisualDetailView, CharacterReferenceDetailView, CommissionAddRemoveCategory, OrderAddRemoveStatus, CommissionAddRemoveOption, OrderAddRemoveOption, CommissionToggleAvailability, CommissionToggleFeatured, CommissionToggleVisibility, CommissionIncrementViewCount, commissionDetailSlugView
+from .views import CommissionView, CommissionDetailView, CommissionOrderView, CommissionOrderDetailView, CommissionCategoryView, CommissionCategoryDetailView, CommissionOptionDetailView, CommissionOptionView, CommissionStatusView, CommissionVisualView, CharacterReferenceView, CommissionStatusDetailView, CommissionVisualDetailView, CharacterReferenceDetailView, CommissionAddRemoveCategory, OrderAddRemoveStatus, CommissionAddRemoveOption, OrderAddRemoveOption, CommissionToggleAvailability, CommissionToggleFeatured, CommissionToggleVisibility, CommissionIncrementViewCount, commissionDetailSlugView, MediaProcessingJobView, MediaProcessingJobDetailView, VisualUploadView, VisualUploadDetailView, VisualUploadChunkView, VisualUploadFinalizeView
 
 urlpatterns = [
     path('commissions/', CommissionView.as_view(), name='commissions'),
@@ -21,6 +21,18 @@ urlpatterns = [
          name='commissions-visuals'),
     path('commissions/visuals/<int:pk>/',
          CommissionVisualDetailView.as_view(), name='commissions-visuals-detail'),
+    path('commissions/visuals/uploads/', VisualUploadView.as_view(),
+         name='commissions-visual-uploads'),
+    path('commissions/visuals/uploads/<uuid:pk>/',
+         VisualUploadDetailView.as_view(), name='commissions-visual-uploads-detail'),
+    path('commissions/visuals/uploads/<uuid:pk>/chunks/<int:index>/',
+         VisualUploadChunkView.as_view(), name='commissions-visual-uploads-chunk'),
+    path('commissions/visuals/uploads/<uuid:pk>/finalize/',
+         VisualUploadFinalizeView.as_view(), name='commissions-visual-uploads-finalize'),
+    path('commissions/media-jobs/', MediaProcessingJobView.as_view(),
+         name='commissions-media-jobs'),
+    path('commissions/media-jobs/<int:pk>/',
+         MediaProcessingJobDetailView.as_view(), name='commissions-media-jobs-detail'),
     path('commissions/orders/', CommissionOrderView.as_view(),
          name='commissions-orders'),
     path('commissions/orders/<int:pk>/',
@@ -1,26 +1,44 @@
 from django.shortcuts import render, get_object_or_404
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .serializers import CommissionSerializer, CommissionCategorySerializer, CommissionVisualSerializer, CommissionOptionSerializer, CommissionOrderSerializer, CommissionStatusSerializer, CharacterReferenceSerializer, AnonymousCharacterReferenceSerializer, AnonymousOrderSerializer
+from .serializers import CommissionSerializer, CommissionCategorySerializer, CommissionVisualSerializer, CommissionOptionSerializer, CommissionOrderSerializer, CommissionStatusSerializer, CharacterReferenceSerializer, AnonymousCharacterReferenceSerializer, AnonymousOrderSerializer, CommissionOrderCreateSerializer, MediaProcessingJobSerializer, VisualUploadSerializer
 from rest_framework import generics, mixins, status, permissions, request
 from customAuth.backends import JWTAuthentication, PermanentTokenAuthentication
-from .models import Commission, CommissionCategory, CommissionVisual, CommissionOption, CommissionOrder, CommissionStatus, CharacterReference
+from siteapi.response_cache import CachedResponseMixin, conditional_get
+from django.utils.decorators import method_decorator
+from django.db import transaction
+from django.db.models import Prefetch
+from .models import Commission, CommissionCategory, CommissionVisual, CommissionVisualVariant, CommissionOption, CommissionOrder, CommissionStatus, CharacterReference, MediaProcessingJob, VisualUpload
+from . import chunked_uploads
+from .counters import view_counter
+from .pagination import CommissionOrderPagination, CommissionVisualPagination, CharacterReferencePagination
 import traceback
 
 # TODO: ensure there are not multiple matching exlcusive_with options for a single commission?
 
+# ETag/Last-Modified validators. GETs that send a matching If-None-Match or If-Modified-Since get a 304.
+commission_conditional_get = method_decorator(conditional_get(
+    Commission, related_models=[CommissionOption, CommissionCategory, CommissionVisual]), name='dispatch')
+order_conditional_get = method_decorator(conditional_get(
+    CommissionOrder, related_models=[CommissionOption, CommissionStatus, CharacterReference]), name='dispatch')
+
 # get all commissions or create a new one
 
 
-class CommissionView(generics.GenericAPIView, mixins.ListModelMixin):
+@commission_conditional_get
+class CommissionView(CachedResponseMixin, generics.GenericAPIView, mixins.ListModelMixin):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    cache_models = [Commission, CommissionOption,
+                    CommissionCategory, CommissionVisual]
 
     serializer_class = CommissionSerializer
 
     def get_queryset(self):
         # fileter by category
-        queryset = Commission.objects.all()
+        queryset = CommissionSerializer.trim_queryset(
+            Commission.objects.with_related(), self.request)
         category = self.request.query_params.get('category', None)
         abdl = self.request.query_params.get('abdl', None)
         adult = self.request.query_params.get('adult', None)
@@ -52,12 +70,15 @@ class CommissionView(generics.GenericAPIView, mixins.ListModelMixin):
 # get, update, or delete a specific commission via its id
 
 
+@commission_conditional_get
 class CommissionDetailView(generics.GenericAPIView, mixins.UpdateModelMixin, mixins.DestroyModelMixin, mixins.RetrieveModelMixin):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     serializer_class = CommissionSerializer
-    queryset = Commission.objects.all()
+
+    def get_queryset(self):
+        return CommissionSerializer.trim_queryset(Commission.objects.with_related(), self.request)
 
     # updates can be partial
     def put(self, request, *args, **kwargs):
@@ -72,14 +93,19 @@ class CommissionDetailView(generics.GenericAPIView, mixins.UpdateModelMixin, mix
 # will be routed to a url that uses slugs instead. same as regular detail view.
 
 
-class commissionDetailSlugView(generics.GenericAPIView, mixins.UpdateModelMixin, mixins.DestroyModelMixin, mixins.RetrieveModelMixin):
+@commission_conditional_get
+class commissionDetailSlugView(CachedResponseMixin, generics.GenericAPIView, mixins.UpdateModelMixin, mixins.DestroyModelMixin, mixins.RetrieveModelMixin):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    cache_models = [Commission, CommissionOption,
+                    CommissionCategory, CommissionVisual]
 
     serializer_class = CommissionSerializer
-    queryset = Commission.objects.all()
     lookup_field = "slug"
 
+    def get_queryset(self):
+        return CommissionSerializer.trim_queryset(Commission.objects.with_related(), self.request)
+
     # updates can be partial
     def put(self, request, *args, **kwargs):
         return self.partial_update(request=request, *args, **kwargs)
@@ -98,16 +124,16 @@ class CommissionAddRemoveOption(APIView):
 
     def get(self, request, commission_id, option_id, *args, **kwargs):
         option = get_object_or_404(CommissionOption, id=option_id)
-        return Response({"option": CommissionOptionSerializer(option, context={'request': request}).data, "commissions": CommissionSerializer(Commission.objects.filter(options=option), many=True, context={'request': request}).data})
+        return Response({"option": CommissionOptionSerializer(option, context={'request': request}).data, "commissions": CommissionSerializer(Commission.objects.with_related().filter(options=option), many=True, context={'request': request}).data})
 
     def post(self, request, commission_id, option_id, *args, **kwargs):
-        commission = get_object_or_404(Commission, id=commission_id)
+        commission = get_object_or_404(Commission.objects.with_related(), id=commission_id)
         option = get_object_or_404(CommissionOption, id=option_id)
         commission.options.add(option)
         return Response(CommissionSerializer(commission, context={'request': request}).data)
 
     def delete(self, request, commission_id, option_id, *args, **kwargs):
-        commission = get_object_or_404(Commission, id=commission_id)
+        commission = get_object_or_404(Commission.objects.with_related(), id=commission_id)
         option = get_object_or_404(CommissionOption, id=option_id)
         commission.options.remove(option)
         return Response(CommissionSerializer(commission, context={'request': request}).data)
@@ -179,6 +205,17 @@ class CommissionVisualView(generics.GenericAPIView, mixins.ListModelMixin):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     serializer_class = CommissionVisualSerializer
+    pagination_class = CommissionVisualPagination
+
+    def get_size_param(self, name):
+        # the size filters end up in integer comparisons, so anything else is a bad request rather than a query error
+        value = self.request.query_params.get(name, None)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({name: "A whole number is required."})
 
     def get_queryset(self):
         queryset = CommissionVisual.objects.all()
@@ -186,8 +223,12 @@ class CommissionVisualView(generics.GenericAPIView, mixins.ListModelMixin):
         group_id = self.request.query_params.get("group_id", None)
         abdl = self.request.query_params.get('abdl', None)
         adult = self.request.query_params.get('adult', None)
-        size = self.request.query_params.get('size', None)
+        size = self.get_size_param('size')
+        min_size = self.get_size_param('min_size')
+        max_size = self.get_size_param('max_size')
         is_video = self.request.query_params.get('is_video', None)
+        processing_state = self.request.query_params.get(
+            'processing_state', None)
         if commission_id is not None:
             queryset = queryset.filter(commission=commission_id)
         if group_id is not None:
@@ -196,13 +237,23 @@ class CommissionVisualView(generics.GenericAPIView, mixins.ListModelMixin):
             queryset = queryset.filter(abdl=abdl)
         if adult is not None:
             queryset = queryset.filter(adult=adult)
+        # sizes are the rungs of the thumbnail ladder (256, 512, 1024 etc. up to the original size of the image).
+        # visuals are narrowed down to the ones that have a matching variant, and srcset to the matching variants
+        variants = CommissionVisualVariant.objects.all()
         if size is not None:
-            # size is not part of the model, but instead appended as _256 or _512 to the file name
-            # filtering the queryset by visual (which is a file name) ending with the size
-            # note that the only available options will be 256, 512, 1024 etc. up to the original size of the image.
-            queryset = queryset.filter(visual__icontains="_"+size)
+            variants = variants.filter(size=size)
+        if min_size is not None:
+            variants = variants.filter(size__gte=min_size)
+        if max_size is not None:
+            variants = variants.filter(size__lte=max_size)
+        if size is not None or min_size is not None or max_size is not None:
+            queryset = queryset.filter(pk__in=variants.values('visual_id'))
+        queryset = queryset.prefetch_related(
+            Prefetch('variants', queryset=variants))
         if is_video is not None:
             queryset = queryset.filter(is_video=is_video)
+        if processing_state is not None:
+            queryset = queryset.filter(processing_state=processing_state)
         return queryset
 
     def delete(self, request, *args, **kwargs):
@@ -238,7 +289,7 @@ class CommissionVisualDetailView(generics.GenericAPIView, mixins.UpdateModelMixi
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     serializer_class = CommissionVisualSerializer
-    queryset = CommissionVisual.objects.all()
+    queryset = CommissionVisual.objects.prefetch_related('variants')
     lookup_field = "pk"
 
     def perform_destroy(self, instance):
@@ -258,6 +309,119 @@ class CommissionVisualDetailView(generics.GenericAPIView, mixins.UpdateModelMixi
         return self.retrieve(request=request, pk=pk)
 
 
+class MediaProcessingJobView(generics.ListAPIView):
+    # lists background processing jobs for uploaded visuals, filter by visual_id or state
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    serializer_class = MediaProcessingJobSerializer
+
+    def get_queryset(self):
+        queryset = MediaProcessingJob.objects.all()
+        visual_id = self.request.query_params.get("visual_id", None)
+        state = self.request.query_params.get("state", None)
+        if visual_id is not None:
+            queryset = queryset.filter(visual=visual_id)
+        if state is not None:
+            queryset = queryset.filter(state=state)
+        return queryset
+
+
+class MediaProcessingJobDetailView(generics.RetrieveAPIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    serializer_class = MediaProcessingJobSerializer
+    queryset = MediaProcessingJob.objects.all()
+    lookup_field = 'pk'
+
+
+class VisualUploadView(generics.CreateAPIView):
+    # starts a chunked upload of a visual. takes the same fields as CommissionVisualView.post, except that the file
+    # is replaced by its filename and size. the chunks are then PUT to VisualUploadChunkView
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    serializer_class = VisualUploadSerializer
+
+
+class VisualUploadDetailView(generics.RetrieveDestroyAPIView):
+    # the state of a chunked upload (which chunks are still missing), or DELETE to abandon it
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    serializer_class = VisualUploadSerializer
+    lookup_field = 'pk'
+
+    def get_queryset(self):
+        return VisualUpload.objects.filter(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        chunked_uploads.discard(instance)
+        instance.delete()
+
+
+class VisualUploadChunkView(APIView):
+    # PUT the raw bytes of chunk <index>, with their sha256 hex digest in the X-Chunk-Checksum header
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def put(self, request, pk, index):
+        upload = get_object_or_404(
+            VisualUpload, pk=pk, user=request.user, state=VisualUpload.UPLOADING)
+        try:
+            # straight from the request stream, without parsing (and buffering) the body
+            chunk = chunked_uploads.write_chunk(
+                upload, index, request.stream, request.headers.get('X-Chunk-Checksum'))
+        except chunked_uploads.ChunkError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"index": chunk.index, "size": chunk.size, "checksum": chunk.checksum,
+                         "missing_chunks": chunked_uploads.get_missing_chunks(upload)})
+
+
+class VisualUploadFinalizeView(APIView):
+    # assembles a chunked upload once every chunk is in and hands it to the normal media pipeline, exactly like
+    # CommissionVisualView.post. the whole file's sha256 can be sent as "checksum" to have it verified as well
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        with transaction.atomic():
+            upload = get_object_or_404(
+                VisualUpload.objects.select_for_update(), pk=pk, user=request.user)
+            if upload.state == VisualUpload.COMPLETE and upload.visual is not None:
+                # finalizing again (e.g. after the response was lost) returns the same visual
+                serializer = CommissionVisualSerializer(
+                    upload.visual, context={"request": request})
+                return Response(serializer.data, status=status.HTTP_200_OK)
+            try:
+                file = chunked_uploads.assemble(
+                    upload, request.data.get('checksum', None))
+            except chunked_uploads.ChunkError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                serializer = CommissionVisualSerializer(data={
+                    'visual': file,
+                    'commission': upload.commission_id,
+                    'adult': upload.adult,
+                    'abdl': upload.abdl,
+                    'is_video': upload.is_video,
+                    'order': upload.order,
+                }, context={"request": request})
+                if not serializer.is_valid():
+                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                visual = serializer.save()
+            finally:
+                file.close()
+            upload.state = VisualUpload.COMPLETE
+            upload.visual = visual
+            upload.save()
+            upload.chunks.all().delete()
+        chunked_uploads.discard(upload)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
 class CommissionCategoryView(generics.GenericAPIView, mixins.ListModelMixin, mixins.CreateModelMixin):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -309,16 +473,16 @@ class CommissionAddRemoveCategory(APIView):
 
     def get(self, request, commission_id, category_id, *args, **kwargs):
         category = get_object_or_404(CommissionCategory, id=category_id)
-        return Response({"category": CommissionCategorySerializer(category, context={"request": request}).data, "commissions":  CommissionSerializer(Commission.objects.filter(categories=category), context={"request": request}, many=True).data})
+        return Response({"category": CommissionCategorySerializer(category, context={"request": request}).data, "commissions":  CommissionSerializer(Commission.objects.with_related().filter(categories=category), context={"request": request}, many=True).data})
 
     def post(self, request, commission_id, category_id, *args, **kwargs):
-        commission = get_object_or_404(Commission, id=commission_id)
+        commission = get_object_or_404(Commission.objects.with_related(), id=commission_id)
         category = get_object_or_404(CommissionCategory, id=category_id)
         commission.categories.add(category)
         return Response(CommissionSerializer(commission, context={"request": request}).data)
 
     def delete(self, request, commission_id, category_id, *args, **kwargs):
-        commission = get_object_or_404(Commission, id=commission_id)
+        commission = get_object_or_404(Commission.objects.with_related(), id=commission_id)
         category = get_object_or_404(CommissionCategory, id=category_id)
         commission.categories.remove(category)
         return Response(CommissionSerializer(commission, context={"request": request}).data)
@@ -327,14 +491,20 @@ class CommissionAddRemoveCategory(APIView):
 # --------------------- ORDERS ----------------------------------------------------------------------
 
 
+@order_conditional_get
 class CommissionOrderView(generics.GenericAPIView, mixins.ListModelMixin, mixins.CreateModelMixin):
 
     authentication_classes = [JWTAuthentication, PermanentTokenAuthentication]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     serializer_class = CommissionOrderSerializer
+    pagination_class = CommissionOrderPagination
 
     def get_queryset(self):
-        queryset = CommissionOrder.objects.all()
+        queryset = CommissionOrder.objects.with_related()
+        if not self.request.user.is_anonymous:
+            # anonymous users always get AnonymousOrderSerializer, so there is nothing to trim for them
+            queryset = CommissionOrderSerializer.trim_queryset(
+                queryset, self.request)
         commission_id = self.request.query_params.get("commission_id", None)
         status = self.request.query_params.get("status", None)
         customer_name = self.request.query_params.get("customer_name", None)
@@ -359,9 +529,11 @@ class CommissionOrderView(generics.GenericAPIView, mixins.ListModelMixin, mixins
             queryset = queryset.filter(adult=adult)
         return queryset
 
-    def perform_create(self, serializer):
-        model = serializer.save()
-        model.calculate_subtotal()
+    def get_serializer_class(self):
+        # orders are created (and priced) together with their options and character references
+        if self.request.method == 'POST':
+            return CommissionOrderCreateSerializer
+        return CommissionOrderSerializer
 
     def get(self, request, *args, **kwargs):
 
@@ -369,28 +541,33 @@ class CommissionOrderView(generics.GenericAPIView, mixins.ListModelMixin, mixins
             return self.list(request=request, *args, **kwargs)
         else:
             # return just basic info for anonymous users
-            queryset = self.get_queryset()
+            page = self.paginate_queryset(self.get_queryset())
             serializer = AnonymousOrderSerializer(
-                queryset, many=True, context={'request': request})
-            return Response(serializer.data)
+                page, many=True, context={'request': request})
+            return self.get_paginated_response(serializer.data)
 
     def post(self, request, *args, **kwargs):
         return self.create(request=request, *args, **kwargs)
 
 
+@order_conditional_get
 class CommissionOrderDetailView(generics.GenericAPIView, mixins.UpdateModelMixin, mixins.DestroyModelMixin, mixins.RetrieveModelMixin):
 
     authentication_classes = [JWTAuthentication, PermanentTokenAuthentication]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     serializer_class = CommissionOrderSerializer
-    queryset = CommissionOrder.objects.all()
     lookup_field = 'pk'
 
+    def get_queryset(self):
+        queryset = CommissionOrder.objects.with_related()
+        if not self.request.user.is_anonymous:
+            queryset = CommissionOrderSerializer.trim_queryset(
+                queryset, self.request)
+        return queryset
+
     def perform_update(self, serializer):
+        # CommissionOrderSerializer.update recalculates the subtotal
         serializer.save()
-        instance = self.get_object()
-        instance.calculate_subtotal()
-        instance.commission.calculate_order_count()
 
     def put(self, request, *args, **kwargs):
         return self.partial_update(request=request, *args, **kwargs)
@@ -403,7 +580,8 @@ class CommissionOrderDetailView(generics.GenericAPIView, mixins.UpdateModelMixin
             return self.retrieve(request=request, pk=pk)
         else:
             # return just basic info for anonymous users
-            ord = get_object_or_404(CommissionOrder, id=pk)
+            ord = get_object_or_404(
+                CommissionOrder.objects.with_related(), id=pk)
             serializer = AnonymousOrderSerializer(
                 ord, context={'request': request})
             return Response(serializer.data)
@@ -471,6 +649,7 @@ class CharacterReferenceView(generics.GenericAPIView, mixins.ListModelMixin, mix
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     serializer_class = CharacterReferenceSerializer
+    pagination_class = CharacterReferencePagination
 
     def get_queryset(self):
         queryset = CharacterReference.objects.all()
@@ -494,8 +673,8 @@ class CharacterReferenceView(generics.GenericAPIView, mixins.ListModelMixin, mix
             return self.list(request=request, *args, **kwargs)
         else:
             # return just basic info for anonymous users
-            queryset = self.get_queryset()
-            return Response(AnonymousCharacterReferenceSerializer(queryset, many=True, context={'request': request}).data)
+            page = self.paginate_queryset(self.get_queryset())
+            return self.get_paginated_response(AnonymousCharacterReferenceSerializer(page, many=True, context={'request': request}).data)
 
     def post(self, request, *args, **kwargs):
         return self.create(request=request, *args, **kwargs)
@@ -548,12 +727,12 @@ class CommissionToggleFeatured(generics.GenericAPIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
-    queryset = Commission.objects.all()
+    queryset = Commission.objects.with_related()
     serializer_class = CommissionSerializer
     lookup_field = 'pk'
 
     def put(self, request, pk):
-        com = get_object_or_404(Commission, id=pk)
+        com = get_object_or_404(Commission.objects.with_related(), id=pk)
         com.toggle_featured()
         return Response(CommissionSerializer(com, context={'request': request}).data)
 
@@ -562,12 +741,12 @@ class CommissionToggleVisibility(generics.GenericAPIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
-    queryset = Commission.objects.all()
+    queryset = Commission.objects.with_related()
     serializer_class = CommissionSerializer
     lookup_field = 'pk'
 
     def put(self, request, pk):
-        com = get_object_or_404(Commission, id=pk)
+        com = get_object_or_404(Commission.objects.with_related(), id=pk)
         com.toggle_visibility()
         return Response(CommissionSerializer(com, context={'request': request}).data)
 
@@ -576,12 +755,12 @@ class CommissionToggleAvailability(generics.GenericAPIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
-    queryset = Commission.objects.all()
+    queryset = Commission.objects.with_related()
     serializer_class = CommissionSerializer
     lookup_field = 'pk'
 
     def put(self, request, pk):
-        com = get_object_or_404(Commission, id=pk)
+        com = get_object_or_404(Commission.objects.with_related(), id=pk)
         com.toggle_availability()
         return Response(CommissionSerializer(com, context={'request': request}).data)
 
@@ -590,11 +769,13 @@ class CommissionIncrementViewCount(generics.GenericAPIView):
     authentication_classes = [JWTAuthentication, PermanentTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
-    queryset = Commission.objects.all()
+    queryset = Commission.objects.with_related()
     serializer_class = CommissionSerializer
     lookup_field = 'pk'
 
     def put(self, request, pk):
-        com = get_object_or_404(Commission, id=pk)
-        com.increment_view_count()
-        return Response(CommissionSerializer(com, context={'request': request}).data)
+        # the increment is buffered and written in batches by commissions.counters, so just acknowledge it
+        if not Commission.objects.filter(id=pk).exists():
+            return Response({"error": "Commission not found."}, status=status.HTTP_404_NOT_FOUND)
+        view_counter.increment(pk)
+        return Response({"id": pk, "queued": True}, status=status.HTTP_202_ACCEPTED)
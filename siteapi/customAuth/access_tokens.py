@@ -0,0 +1,59 @@
+import time
+
+import jwt
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router
+
+# short lived, stateless alternative to the 60 day CustomJWTToken. an access token carries everything
+# JWTAuthentication needs (the user's id, username and version), so verifying one is a signature check and nothing
+# else. the CustomJWTToken becomes the refresh token: it is only checked against the database by RefreshAccessToken,
+# when a new access token is minted. a changed password or a deactivated user is therefore noticed within
+# ACCESS_TOKEN_LIFETIME seconds, not on the very next request.
+ACCESS_TOKEN_TYPE = 'access'
+
+
+def get_lifetime():
+    return getattr(settings, 'ACCESS_TOKEN_LIFETIME', 5 * 60)
+
+
+def issue_access_token(user):
+    now = int(time.time())
+    payload = {
+        'type': ACCESS_TOKEN_TYPE,
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'version': user.version,
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+        'iat': now,
+        'exp': now + get_lifetime(),
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')
+
+
+def is_access_token(claims):
+    return claims.get('type') == ACCESS_TOKEN_TYPE
+
+
+def get_user(claims):
+    """
+    Returns the user an access token was issued to, built from its claims without a query. It isn't a full row
+    (no password, for one): code that changes the account has to load the user from the database first, see
+    load_user.
+    """
+    UserModel = get_user_model()
+    user = UserModel(id=claims['id'], username=claims['username'], email=claims['email'], version=claims['version'],
+                     is_active=True, is_staff=claims['is_staff'], is_superuser=claims['is_superuser'])
+    user._state.adding = False
+    user._state.db = router.db_for_read(UserModel)
+    user.from_access_token = True
+    return user
+
+
+def load_user(user):
+    # the real row behind a user built by get_user, anything else is returned as is
+    if getattr(user, 'from_access_token', False):
+        return get_user_model().objects.get(pk=user.pk)
+    return user
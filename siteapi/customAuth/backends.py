@@ -2,12 +2,12 @@ from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 from rest_framework.authentication import TokenAuthentication, get_authorization_header
 from .models import CustomJWTToken, TemporaryToken, PermanentToken
+from . import access_tokens, token_cache
+from .token_cache import get_token_cache
 from rest_framework import HTTP_HEADER_ENCODING, exceptions
 from django.conf import settings
 import jwt
 import time
-from django.utils import timezone
-from datetime import timedelta
 
 
 class UsernameBackend(ModelBackend):
@@ -30,12 +30,36 @@ class JWTAuthentication(TokenAuthentication):
     def authenticate_credentials(self, key):
         # token = DB token, key = user-supplied token (lock and key)
 
+        # a token that was verified before (and whose user hasn't changed since) only needs its expiry checked
+        cached = get_token_cache().get(key)
+        if cached is not None:
+            (decoded_key, user) = cached
+            if 'exp' in decoded_key and decoded_key['exp'] < time.time():
+                raise exceptions.AuthenticationFailed('Invalid token OR user not found.')
+            return (user, self.get_model()(user=user, key=key))
+
         try:
             decoded_key = self.verify_jwt_token(key)
         except TypeError as e:
             print(f"TYPE ERROR {e}")
             print(f"key={key}")
             raise exceptions.AuthenticationFailed('Type error.')
+
+        # short lived access tokens are stateless, the signature and expiry were all there was to check
+        if decoded_key is not None and access_tokens.is_access_token(decoded_key):
+            return (access_tokens.get_user(decoded_key), decoded_key)
+
+        (user, token) = self.authenticate_refresh_token(decoded_key)
+        get_token_cache().set(key, decoded_key, user)
+        return (user, token)
+
+    def authenticate_refresh_token(self, decoded_key):
+        """
+        Checks the claims of a CustomJWTToken against the database: the token has to exist and the user has to be
+        active, with the same version and username as when it was issued. Returns (user, token).
+        """
+        if decoded_key is not None and access_tokens.is_access_token(decoded_key):
+            raise exceptions.AuthenticationFailed('An access token can not be used to refresh.')
         model = self.get_model()
         try:
             # gives us the jwt token belonging to the user ID (a foreign key to the jwt token model) from the DB
@@ -90,13 +114,7 @@ class TemporaryTokenAuthentication(TokenAuthentication):
 
         model = self.get_model()
 
-        # every time this authenticate method is called, we want to make sure to purge the database of expired tokens.
-        # set cutoff date to 1 hour ago
-        cutoff_date = timezone.now() - timedelta(hours=1)
-        # filter for items that were created over 1 hour ago ()
-        expired_tokens = model.objects.filter(created__lt=cutoff_date)
-        # delete all expired tokens
-        expired_tokens.delete()
+        # expired tokens are purged by the purge_expired_tokens command, until then they are turned away here
         try:
             # gives us the token from the DB who's key attribute looks like the user-supplied key
             # also preloads the user object while fetching the token from the DB (hence the select_related(user))
@@ -107,11 +125,9 @@ class TemporaryTokenAuthentication(TokenAuthentication):
         if not token.user.is_active:
             raise exceptions.AuthenticationFailed('User inactive or deleted.')
 
-        time_since_creation = timezone.now() - token.created
-        if time_since_creation > timedelta(hours=1):
-            token.delete()
+        if token.is_expired():
             raise exceptions.AuthenticationFailed(
-                'Your temporary authentication token has expired and will now be deleted.')
+                'Your temporary authentication token has expired.')
 
         return (token.user, token)
 
@@ -119,3 +135,24 @@ class TemporaryTokenAuthentication(TokenAuthentication):
 class PermanentTokenAuthentication(TokenAuthentication):
     model = PermanentToken
     keyword = 'Poken'
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get_verified_permanent_token(key)
+        if cached is not None:
+            return cached
+        # read first, so a token revoked while it's being looked up isn't cached as valid
+        generations = token_cache.get_permanent_token_generations()
+        cached = token_cache.get_shared_permanent_token(key, generations)
+        if cached is not None:
+            return cached
+
+        # only a salted digest of the key is stored, see PermanentToken.find
+        token = self.get_model().find(key, self.get_model().objects.select_related('user'))
+        if token is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        token_cache.remember_permanent_token(key, token.user, token, generations)
+        return (token.user, token)
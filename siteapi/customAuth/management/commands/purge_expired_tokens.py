@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from customAuth.models import TemporaryToken
+from siteapi.locks import advisory_lock
+
+
+class Command(BaseCommand):
+    help = ("Deletes expired temporary (registration) tokens. Meant to be run on a schedule, e.g. every few "
+            "minutes from cron, or left running with --loop.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="keep sweeping instead of exiting after one round")
+        parser.add_argument('--interval', type=int, default=300,
+                            help="seconds between rounds with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            # any number of sweepers can be scheduled, only the one holding the lock does a round
+            with advisory_lock('customAuth.purge_expired_tokens') as acquired:
+                if acquired:
+                    purged = TemporaryToken.purge_expired()
+                    if purged:
+                        self.stdout.write("purged %s expired temporary tokens" % purged)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
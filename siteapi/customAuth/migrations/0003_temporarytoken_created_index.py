@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customAuth', '0002_permanenttoken'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='temporarytoken',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:30
+
+import binascii
+import hashlib
+import os
+
+from django.db import migrations, models
+
+PREFIX_LENGTH = 8
+
+
+def hash_permanent_tokens(apps, schema_editor):
+    # the key was the primary key. every row keeps its key, just as a salted digest from now on
+    PermanentToken = apps.get_model('customAuth', 'PermanentToken')
+    for key in list(PermanentToken.objects.values_list('key', flat=True)):
+        salt = binascii.hexlify(os.urandom(16)).decode()
+        PermanentToken.objects.filter(key=key).update(
+            key=hashlib.sha256((salt + key).encode()).hexdigest(), prefix=key[:PREFIX_LENGTH], salt=salt)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customAuth', '0003_temporarytoken_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='permanenttoken',
+            name='prefix',
+            field=models.CharField(db_index=True, default='', max_length=8),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='permanenttoken',
+            name='salt',
+            field=models.CharField(default='', max_length=32),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='permanenttoken',
+            name='key',
+            field=models.CharField(max_length=64, primary_key=True, serialize=False),
+        ),
+        migrations.RunPython(hash_permanent_tokens, migrations.RunPython.noop),
+        migrations.RenameField(
+            model_name='permanenttoken',
+            old_name='key',
+            new_name='digest',
+        ),
+    ]
@@ -2,11 +2,16 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 import jwt
 import binascii
+import hashlib
+import hmac
 import os
 from django.utils.translation import gettext_lazy as _
+from . import token_cache
 
 
 # Create your models here.
@@ -73,10 +78,14 @@ class CustomJWTToken(models.Model):
 
 
 class TemporaryToken(models.Model):
+    # tokens stop working this long after they were created. expired ones are deleted by the
+    # purge_expired_tokens command rather than on the request path
+    LIFETIME = timezone.timedelta(hours=1)
+
     user = models.ForeignKey(
         ScuzzyFoxContentManagerUser, on_delete=models.CASCADE)
     key = models.CharField(_("Key"), max_length=40, primary_key=True)
-    created = models.DateTimeField(auto_now_add=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         # Work around for a bug in Django:
@@ -97,23 +106,72 @@ class TemporaryToken(models.Model):
     def generate_key(cls):
         return binascii.hexlify(os.urandom(20)).decode()
 
+    @classmethod
+    def purge_expired(cls):
+        """Deletes every expired token and returns how many there were."""
+        deleted, _ = cls.objects.filter(created__lt=timezone.now() - cls.LIFETIME).delete()
+        return deleted
+
+    def is_expired(self):
+        return timezone.now() - self.created > self.LIFETIME
+
     def __str__(self):
         return self.key
 
 
 class PermanentToken(models.Model):
+    # long lived tokens for server to server calls. only a salted digest of the key is stored, the key itself is
+    # shown once when the token is created (see create_token). the first PREFIX_LENGTH characters of the key are
+    # kept in the clear to find the row, and to tell tokens apart when listing them
+    PREFIX_LENGTH = 8
+
     user = models.ForeignKey(
         ScuzzyFoxContentManagerUser, on_delete=models.CASCADE)
-    key = models.CharField(_("Key"), max_length=40, primary_key=True)
-
-    def save(self, *args, **kwargs):
-        if not self.key:
-            self.key = self.generate_key()
-        return super().save(*args, **kwargs)
+    digest = models.CharField(max_length=64, primary_key=True)
+    prefix = models.CharField(max_length=PREFIX_LENGTH, db_index=True)
+    salt = models.CharField(max_length=32)
 
     @classmethod
     def generate_key(cls):
         return binascii.hexlify(os.urandom(20)).decode()
 
+    @staticmethod
+    def hash_key(salt, key):
+        return hashlib.sha256((salt + key).encode()).hexdigest()
+
+    @classmethod
+    def create_token(cls, user):
+        """Creates a token for `user` and returns (token, key). The key can't be recovered later."""
+        key = cls.generate_key()
+        salt = binascii.hexlify(os.urandom(16)).decode()
+        token = cls.objects.create(user=user, digest=cls.hash_key(salt, key), prefix=key[:cls.PREFIX_LENGTH],
+                                   salt=salt)
+        return (token, key)
+
+    @classmethod
+    def find(cls, key, queryset=None):
+        """Returns the token whose key is `key`, or None. Reads the rows sharing its prefix, usually just the one."""
+        if not key:
+            return None
+        queryset = cls.objects.all() if queryset is None else queryset
+        for token in queryset.filter(prefix=key[:cls.PREFIX_LENGTH]):
+            if hmac.compare_digest(token.digest, cls.hash_key(token.salt, key)):
+                return token
+        return None
+
     def __str__(self):
-        return self.key
+        return self.prefix
+
+
+@receiver(post_save, sender=ScuzzyFoxContentManagerUser)
+@receiver(post_delete, sender=ScuzzyFoxContentManagerUser)
+@receiver(post_delete, sender=CustomJWTToken)
+def invalidate_verified_tokens(sender, **kwargs):
+    # a new version, deactivation or deletion has to reach tokens JWTAuthentication already verified
+    token_cache.invalidate()
+
+
+@receiver(post_delete, sender=PermanentToken)
+def invalidate_verified_permanent_tokens(sender, **kwargs):
+    # revocation has to reach every process that cached the token as verified
+    token_cache.invalidate_permanent_tokens()
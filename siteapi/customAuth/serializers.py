@@ -102,6 +102,7 @@ class ListPermanentTokenSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PermanentToken
-        fields = ['key']
+        # the key itself isn't stored, only its first few characters
+        fields = ['prefix']
         extra_kwargs = {
-            'key': {'read_only': True, "required": True}}
+            'prefix': {'read_only': True}}
@@ -1,3 +1,179 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.test import APIClient
+
+from . import access_tokens
+from .backends import PermanentTokenAuthentication, TemporaryTokenAuthentication
+from .models import PermanentToken, ScuzzyFoxContentManagerUser, TemporaryToken
+from .token_cache import get_permanent_token_cache, get_token_cache
+
+
+class VerifiedTokenCacheTests(TestCase):
+    """A JWT that was verified once is authenticated again without touching the database."""
+
+    def setUp(self):
+        cache.clear()
+        get_token_cache().clear()
+        self.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + self.user.jwt_auth_token.key)
+        self.url = reverse('check-jwt-token')
+
+    def test_hit_needs_no_queries(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deactivation_invalidates(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_new_version_invalidates(self):
+        self.client.get(self.url)
+        self.user.set_password("password456")
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_other_process_sees_stamp(self):
+        self.client.get(self.url)
+        # what another worker's invalidation looks like from here: the shared generation moves on, the entries
+        # of this process are still there
+        ScuzzyFoxContentManagerUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        cache.clear()
+        get_token_cache().stamp_checked = None
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class TemporaryTokenTests(TestCase):
+    """Expired temporary tokens are refused at lookup and deleted by purge_expired_tokens, not by requests."""
+
+    def setUp(self):
+        self.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+        self.fresh = TemporaryToken.objects.create(user=self.user)
+        self.expired = TemporaryToken.objects.create(user=self.user)
+        TemporaryToken.objects.filter(pk=self.expired.pk).update(
+            created=timezone.now() - TemporaryToken.LIFETIME - timezone.timedelta(minutes=1))
+
+    def test_lookup_is_one_read(self):
+        with self.assertNumQueries(1):
+            (user, token) = TemporaryTokenAuthentication().authenticate_credentials(self.fresh.key)
+        self.assertEqual(user, self.user)
+        with self.assertNumQueries(1):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                TemporaryTokenAuthentication().authenticate_credentials(self.expired.key)
+
+    def test_purge_command(self):
+        call_command('purge_expired_tokens', stdout=StringIO())
+        self.assertEqual(list(TemporaryToken.objects.values_list('key', flat=True)), [self.fresh.key])
+
+
+class PermanentTokenTests(TestCase):
+    """Permanent tokens are stored as salted digests and verified ones are cached until something is revoked."""
+
+    def setUp(self):
+        cache.clear()
+        get_permanent_token_cache().clear()
+        self.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + self.user.jwt_auth_token.key)
+        response = self.client.post(reverse('permanent-tokens'))
+        self.assertEqual(response.status_code, 201)
+        self.key = response.data['Token']
+
+    def test_key_is_not_stored(self):
+        token = PermanentToken.objects.get()
+        self.assertNotIn(self.key, [token.digest, token.prefix, token.salt])
+        self.assertEqual(self.client.get(reverse('permanent-tokens')).data, [{'prefix': self.key[:8]}])
+
+    def test_verified_token_is_cached_until_revoked(self):
+        authentication = PermanentTokenAuthentication()
+        with self.assertNumQueries(1):
+            (user, token) = authentication.authenticate_credentials(self.key)
+        self.assertEqual(user, self.user)
+        with self.assertNumQueries(0):
+            authentication.authenticate_credentials(self.key)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            authentication.authenticate_credentials(self.key[:-1] + 'x')
+
+        response = self.client.delete(reverse('permanent-tokens'), {'token': self.key})
+        self.assertEqual(response.status_code, 204)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            authentication.authenticate_credentials(self.key)
+
+    def test_hit_needs_no_shared_cache(self):
+        authentication = PermanentTokenAuthentication()
+        authentication.authenticate_credentials(self.key)
+        with mock.patch('customAuth.token_cache.cache') as shared_cache, self.assertNumQueries(0):
+            (user, token) = authentication.authenticate_credentials(self.key)
+        self.assertEqual(user, self.user)
+        self.assertFalse(shared_cache.method_calls)
+
+        # another process verified it, this one finds it in the shared cache
+        get_permanent_token_cache().clear()
+        with self.assertNumQueries(0):
+            authentication.authenticate_credentials(self.key)
+
+    def test_revoke_by_prefix(self):
+        response = self.client.delete(reverse('permanent-tokens'), {'token': self.key[:8]})
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(PermanentToken.objects.exists())
+
+
+class AccessTokenTests(TestCase):
+    """Short lived access tokens are verified without the database, refreshing them is what checks the user."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+        self.client = APIClient()
+        self.refresh_token = self.user.jwt_auth_token.key
+
+    def refresh(self, refresh_token):
+        return self.client.post(reverse('refresh-access-token'), {'refresh_token': refresh_token}, format='json')
+
+    def test_access_token_needs_no_queries(self):
+        response = self.refresh(self.refresh_token)
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + response.data['access_token'])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('check-jwt-token'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_expired_access_token(self):
+        with self.settings(ACCESS_TOKEN_LIFETIME=-1):
+            access_token = access_tokens.issue_access_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + access_token)
+        self.assertEqual(self.client.get(reverse('check-jwt-token')).status_code, 401)
+
+    def test_refresh_checks_the_user(self):
+        access_token = self.refresh(self.refresh_token).data['access_token']
+        # an access token can't mint more of itself
+        self.assertEqual(self.refresh(access_token).status_code, 401)
+
+        self.user.set_password("password456")
+        self.user.save()
+        self.assertEqual(self.refresh(self.refresh_token).status_code, 401)
+        self.user.refresh_from_db()
+        self.assertEqual(self.refresh(self.user.jwt_auth_token.key).status_code, 200)
 
-# Create your tests here.
+    def test_change_password_with_access_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + self.refresh(self.refresh_token).data['access_token'])
+        response = self.client.post(reverse('reset'), {
+            'old_password': 'password123', 'new_password': 'password456', 'confirm_new_password': 'password456'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('password456'))
+        self.assertTrue(self.user.is_superuser)
@@ -0,0 +1,162 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+from siteapi.response_cache import bump_generation, get_generations
+
+# JWTAuthentication verifies a token's signature and loads its user on every request, mostly for the same few
+# tokens polled over and over by the dashboard. tokens that passed are remembered here, per process, together with
+# their claims and a snapshot of the user, so authenticating them again doesn't touch the database.
+#
+# any change to a user (a new version after a password change, deactivation, deletion) bumps the generation of
+# the user model in the shared cache. the process that made the change drops its entries straight away, every
+# other process notices the new generation the next time it checks, at most JWT_CACHE_STAMP_INTERVAL seconds later.
+#
+# permanent tokens (server to server calls) are verified against a salted digest. they are remembered the same way
+# in a second per process cache, stamped with the generations of the user and PermanentToken models, and behind that
+# in the shared django cache, keyed by a digest of the token, so a process that hasn't seen a token yet doesn't have
+# to verify it again either. deleting a token bumps the PermanentToken generation, which revokes every cached one at
+# once.
+_cache = None
+_permanent_token_cache = None
+PERMANENT_TOKEN_CACHE_TIMEOUT = getattr(
+    settings, 'PERMANENT_TOKEN_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_token_cache():
+    global _cache
+    if _cache is None:
+        _cache = VerifiedTokenCache(getattr(settings, 'JWT_CACHE_SIZE', 1024),
+                                    getattr(settings, 'JWT_CACHE_STAMP_INTERVAL', 1))
+    return _cache
+
+
+def get_permanent_token_cache():
+    global _permanent_token_cache
+    if _permanent_token_cache is None:
+        _permanent_token_cache = VerifiedTokenCache(
+            getattr(settings, 'PERMANENT_TOKEN_CACHE_SIZE', 256), getattr(settings, 'JWT_CACHE_STAMP_INTERVAL', 1),
+            stamp_models=[settings.AUTH_USER_MODEL, 'customAuth.PermanentToken'])
+    return _permanent_token_cache
+
+
+def get_token_digest(key):
+    # entries are keyed by a digest so the tokens themselves don't sit around in memory
+    return hashlib.sha256(key.encode()).digest()
+
+
+def invalidate():
+    """Forgets every verified token, in this process right away and in every other one on its next stamp check."""
+    bump_generation(apps.get_model(settings.AUTH_USER_MODEL))
+    get_token_cache().clear()
+    get_permanent_token_cache().clear()
+
+
+def get_permanent_token_generations():
+    """Read these before looking a token up and pass them to remember_permanent_token."""
+    return get_generations([apps.get_model(settings.AUTH_USER_MODEL), apps.get_model('customAuth', 'PermanentToken')])
+
+
+def get_permanent_token_cache_key(key):
+    return 'permanent-token:%s' % hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_verified_permanent_token(key):
+    """
+    Returns (user, token) for a permanent token this process verified since nothing was revoked, or None. costs no
+    i/o, apart from the throttled stamp check.
+    """
+    entry = get_permanent_token_cache().get(key)
+    if entry is None:
+        return None
+    (token, user) = entry
+    return (user, token)
+
+
+def get_shared_permanent_token(key, generations):
+    """Returns (user, token) for a permanent token any process verified since nothing was revoked, or None."""
+    entry = cache.get(get_permanent_token_cache_key(key))
+    if entry is None or entry['generations'] != generations:
+        return None
+    get_permanent_token_cache().set(key, entry['token'], entry['user'], stamp=generations)
+    return (entry['user'], entry['token'])
+
+
+def remember_permanent_token(key, user, token, generations):
+    get_permanent_token_cache().set(key, token, user, stamp=generations)
+    cache.set(get_permanent_token_cache_key(key), {'generations': generations, 'user': user, 'token': token},
+              PERMANENT_TOKEN_CACHE_TIMEOUT)
+
+
+def invalidate_permanent_tokens():
+    bump_generation(apps.get_model('customAuth', 'PermanentToken'))
+    get_permanent_token_cache().clear()
+
+
+class VerifiedTokenCache:
+    """
+    A thread safe LRU of token digest -> (claims, user), dropped as a whole when the generation of one of
+    `stamp_models` (model labels, the user model by default) changes.
+    """
+
+    def __init__(self, max_size, stamp_interval, stamp_models=None):
+        self.max_size = max_size
+        self.stamp_interval = stamp_interval
+        self.stamp_models = stamp_models or [settings.AUTH_USER_MODEL]
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.stamp_checked = None
+
+    def check_stamp(self):
+        # the generation is only read from the shared cache every stamp_interval seconds, in between a hit costs
+        # no i/o at all
+        now = time.monotonic()
+        if self.stamp_checked is not None and now - self.stamp_checked < self.stamp_interval:
+            return
+        stamp = get_generations([apps.get_model(label) for label in self.stamp_models])
+        with self.lock:
+            if stamp != self.stamp:
+                self.entries.clear()
+                self.stamp = stamp
+            self.stamp_checked = now
+
+    def get(self, key):
+        """Returns (claims, user) for a token that was verified before, or None. The user is a copy of the snapshot."""
+        self.check_stamp()
+        digest = get_token_digest(key)
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None:
+                return None
+            self.entries.move_to_end(digest)
+        (claims, user) = entry
+        return (claims, copy.copy(user))
+
+    def set(self, key, claims, user, stamp=None):
+        """
+        Remembers a verified token. `stamp`, if given, are the generations read before the token was verified: an
+        entry verified before a change this cache has already seen is dropped rather than remembered.
+        """
+        if self.max_size <= 0:
+            return
+        digest = get_token_digest(key)
+        with self.lock:
+            if stamp is not None and stamp != self.stamp:
+                return
+            self.entries[digest] = (claims, copy.copy(user))
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            # read the generation again before the next hit, the change that caused this bumped it
+            self.stamp_checked = None
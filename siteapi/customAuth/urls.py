@@ -1,10 +1,12 @@
-from .views import Register, Login, ResetPassword, CheckJWTToken, DeleteUser, ListUsers, ListTempTokens, ListJWTTokens, GenerateDeleteOrListPermanentToken
+from .views import Register, Login, ResetPassword, CheckJWTToken, DeleteUser, ListUsers, ListTempTokens, ListJWTTokens, GenerateDeleteOrListPermanentToken, RefreshAccessToken
 from django.urls import path
 
 urlpatterns = [
     path("register/", Register.as_view(), name="register"),
     path("login/", Login.as_view(), name="register"),
     path("change-password/", ResetPassword.as_view(), name="reset"),
+    path("refresh-access-token/", RefreshAccessToken.as_view(),
+         name="refresh-access-token"),
     path("check-jwt-token/", CheckJWTToken.as_view(), name="check-jwt-token"),
     path("delete-user/", DeleteUser.as_view(), name="delete-user"),
     path("users/", ListUsers.as_view(), name="list-users"),
@@ -5,11 +5,11 @@ from rest_framework.views import APIView
 from django.contrib.auth import authenticate
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
 from .models import CustomJWTToken, ScuzzyFoxContentManagerUser, TemporaryToken, PermanentToken
 from .backends import TemporaryTokenAuthentication, JWTAuthentication
-from django.utils import timezone
-from datetime import timedelta
 from rest_framework import permissions
+from . import access_tokens
 
 
 # List the temporary tokens that currently exist
@@ -38,14 +38,7 @@ class Register(APIView):
     def get(self, request):
         """generates and returns a token for someone to register to the site if you provide your JWT token."""
 
-        # deletes all tokens that are older than an hour
-        # set cutoff date to 1 hour ago
-        cutoff_date = timezone.now() - timedelta(hours=1)
-        # filter for items that were created over 1 hour ago ()
-        expired_tokens = TemporaryToken.objects.filter(created__lt=cutoff_date)
-        # delete all expired tokens
-        expired_tokens.delete()
-
+        # expired tokens are deleted by the purge_expired_tokens command
         # create a token belonging to the logged in user.
         token = TemporaryToken.objects.create(user=request.user)
 
@@ -94,7 +87,10 @@ class Login(APIView):
             # refresh the jwt token (expiration and version number).
             CustomJWTToken.objects.get(user=user).save()
 
-            return Response(UserSerializer(user).data)
+            data = UserSerializer(user).data
+            # the jwt token doubles as the refresh token for short lived access tokens, see RefreshAccessToken
+            data["access_token"] = access_tokens.issue_access_token(user)
+            return Response(data)
         else:
             return Response({"error": "Wrong Credentials"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -105,7 +101,8 @@ class ResetPassword(APIView):
     authentication_classes = [JWTAuthentication]
 
     def post(self, request):
-        user = request.user
+        # a user authenticated by an access token isn't a whole row, and it is about to be saved
+        user = access_tokens.load_user(request.user)
         content = request.data.copy()
         content["username"] = user.username
 
@@ -124,6 +121,27 @@ class ResetPassword(APIView):
             return Response({"error": "could not validate new passwords", "errors": serializer.errors}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class RefreshAccessToken(APIView):
+    """Trades a JWT token (the long lived one returned by login) for a short lived access token.
+
+    This is the only time the JWT token is checked against the database when clients use access tokens."""
+    authentication_classes = ()
+    permission_classes = ()
+
+    def post(self, request):
+        authentication = JWTAuthentication()
+        decoded_key = authentication.verify_jwt_token(str(request.data.get("refresh_token") or ""))
+        if decoded_key is None:
+            return Response({"error": "Invalid refresh token."}, status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            user, token = authentication.authenticate_refresh_token(decoded_key)
+        except AuthenticationFailed as e:
+            # the token was replaced, or the user changed their password or was deactivated
+            return Response({"error": e.detail}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response({"access_token": access_tokens.issue_access_token(user),
+                         "expires_in": access_tokens.get_lifetime()})
+
+
 class CheckJWTToken(APIView):
     """Checks if a JWT token is valid."""
     authentication_classes = [JWTAuthentication]
@@ -173,14 +191,20 @@ class GenerateDeleteOrListPermanentToken(APIView):
 
     def post(self, request):
         user = request.user
-        token = PermanentToken.objects.create(user=user)
+        # the only time the key is available, just its digest is stored
+        token, key = PermanentToken.create_token(user)
 
-        return Response({"Token": token.key}, status=status.HTTP_201_CREATED)
+        return Response({"Token": key, "prefix": token.prefix}, status=status.HTTP_201_CREATED)
 
     def delete(self, request):
-        token = request.data.get("token")
-        try:
-            PermanentToken.objects.get(key=token).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except PermanentToken.DoesNotExist:
+        """Revokes a token given the whole key, or the prefix of one of your own tokens as listed by get."""
+        key = str(request.data.get("token") or "")
+        token = PermanentToken.find(key)
+        if token is None and len(key) == PermanentToken.PREFIX_LENGTH:
+            matches = list(PermanentToken.objects.filter(user=request.user, prefix=key)[:2])
+            token = matches[0] if len(matches) == 1 else None
+        if token is None:
             return Response({"error": "Token not found. Typo or already deleted token."}, status=status.HTTP_404_NOT_FOUND)
+        # deleting it revokes every cached verification of it, see customAuth.token_cache
+        token.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:02
+
+from django.db import migrations, models
+import goals.models
+import media_store.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goals', '0007_alter_goal_options'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='goal',
+            name='image',
+            field=models.ImageField(storage=media_store.storage.ContentAddressedStorage(), upload_to=goals.models.Goal.get_file_path),
+        ),
+    ]
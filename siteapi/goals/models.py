@@ -4,6 +4,8 @@ import uuid
 from django.db import models
 from django.dispatch import receiver
 from django.utils import timezone
+from media_store.storage import blob_storage, manage_blob_fields
+from siteapi.response_cache import bump_generation
 
 
 # Create your models here.
@@ -32,7 +34,7 @@ class Goal(models.Model):
     date_fulfilled = models.DateTimeField(blank=True, null=True)
     slug = models.SlugField(db_index=True, unique=True)
     image = models.ImageField(
-        upload_to=get_file_path)
+        upload_to=get_file_path, storage=blob_storage)
     image_alt = models.CharField(max_length=100)
     priority = models.IntegerField(default=0)
 
@@ -47,33 +49,15 @@ class Goal(models.Model):
             self.save()
 
 
-@receiver(models.signals.post_delete, sender=Goal)
-def auto_delete_file_on_delete(sender, instance, **kwargs):
-    """
-    Deletes file from filesystem
-    when corresponding `MediaFile` object is deleted.
-    """
-    if instance.image:
-        if os.path.isfile(instance.image.path):
-            os.remove(instance.image.path)
+# the image's blob reference is given back when a goal is deleted or its image replaced
+manage_blob_fields(Goal, 'image')
 
 
-@receiver(models.signals.pre_save, sender=Goal)
-def auto_delete_file_on_change(sender, instance, **kwargs):
+@receiver(models.signals.post_save, sender=Goal)
+@receiver(models.signals.post_delete, sender=Goal)
+def bump_goal_generation(sender, **kwargs):
     """
-    Deletes old file from filesystem
-    when corresponding `MediaFile` object is updated
-    with new file.
+    Makes cached goal responses unreachable
+    when any goal is saved or deleted.
     """
-    if not instance.pk:
-        return False
-
-    try:
-        old_file = Goal.objects.get(pk=instance.pk).image
-    except Goal.DoesNotExist:
-        return False
-
-    new_file = instance.image
-    if not old_file == new_file:
-        if os.path.isfile(old_file.path):
-            os.remove(old_file.path)
+    bump_generation(sender)
@@ -5,19 +5,29 @@ from rest_framework.views import APIView
 from customAuth.backends import JWTAuthentication
 from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
+from siteapi.response_cache import CachedResponseMixin, conditional_get
+from django.utils.decorators import method_decorator
 
+# ETag/Last-Modified validators. GETs that send a matching If-None-Match or If-Modified-Since get a 304.
+# goals have no modified column, edits are picked up through the goal generation instead.
+goal_conditional_get = method_decorator(conditional_get(
+    Goal, modified_fields=('created', 'date_fulfilled')), name='dispatch')
 
-class ListGoals(generics.ListAPIView):
+
+@goal_conditional_get
+class ListGoals(CachedResponseMixin, generics.ListAPIView):
     """
     A view that returns a list of goals.
 
-    This view has no authentication or permission requirements.
+    This view has no authentication or permission requirements. Responses are cached until a goal changes.
     """
     permission_classes = ()
+    cache_models = [Goal]
     serializer_class = GoalSerializer
     queryset = Goal.objects.all()
 
 
+@goal_conditional_get
 class GoalDetail(generics.RetrieveAPIView):
     """
     A view that returns a single goal by ID.
@@ -29,13 +39,15 @@ class GoalDetail(generics.RetrieveAPIView):
     queryset = Goal.objects.all()
 
 
-class GoalDetailSlug(generics.RetrieveAPIView):
+@goal_conditional_get
+class GoalDetailSlug(CachedResponseMixin, generics.RetrieveAPIView):
     """
     A view that returns a single goal by slug.
 
-    This view has no authentication or permission requirements.
+    This view has no authentication or permission requirements. Responses are cached until a goal changes.
     """
     permission_classes = ()
+    cache_models = [Goal]
     serializer_class = GoalSerializer
     queryset = Goal.objects.all()
     lookup_field = "slug"
@@ -0,0 +1,72 @@
+import base64
+import binascii
+import re
+import tempfile
+
+from django.core.files import File
+from PIL import Image
+
+from .storage import blob_storage
+
+DATA_URL = re.compile(r'^data:(?P<mime_type>[\w.+-]+/[\w.+-]+)?(?:;[^;,]*)*?;base64,', re.IGNORECASE)
+# a multiple of 4, so every piece decodes on its own
+DECODE_SIZE = 64 * 1024
+# decoded files are kept in memory up to this size, bigger ones spill to disk
+SPOOL_SIZE = 1024 * 1024
+
+
+class DataURLError(ValueError):
+    pass
+
+
+def is_data_url(value):
+    return bool(value) and DATA_URL.match(value[:256]) is not None
+
+
+def decode_data_url(data_url, max_size=None):
+    """
+    Decodes a base64 data url a piece at a time into a temporary file, so the decoded bytes never sit in memory
+    next to the encoded string in full. Returns (mime type, file) with the file positioned at its start.
+
+    Raises DataURLError for anything that isn't a base64 data url, or one that decodes to more than `max_size`
+    bytes.
+    """
+    match = DATA_URL.match(data_url[:256]) if data_url else None
+    if match is None:
+        raise DataURLError("not a base64 data url")
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    size = 0
+    try:
+        for position in range(match.end(), len(data_url), DECODE_SIZE):
+            piece = base64.b64decode(data_url[position:position + DECODE_SIZE], validate=True)
+            size += len(piece)
+            if max_size is not None and size > max_size:
+                raise DataURLError("data url is bigger than %s bytes" % max_size)
+            file.write(piece)
+    except binascii.Error as e:
+        file.close()
+        raise DataURLError("data url is not valid base64: %s" % e)
+    except DataURLError:
+        file.close()
+        raise
+    file.seek(0)
+    return ((match['mime_type'] or 'text/plain').lower(), file)
+
+
+def store_image_data_url(data_url, name, max_size=None, format='WEBP'):
+    """
+    Decodes an image data url, re-encodes it as `format` and stores it in blob_storage. `name` is only used for
+    its extension. Returns (blob name, width, height); the caller owns the reference the blob was saved with.
+    """
+    (mime_type, decoded) = decode_data_url(data_url, max_size)
+    encoded = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    with decoded, encoded:
+        if not mime_type.startswith('image/'):
+            raise DataURLError("data url is %s, not an image" % mime_type)
+        try:
+            with Image.open(decoded) as image:
+                (width, height) = image.size
+                image.save(encoded, format=format)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise DataURLError("data url is not a readable image: %s" % e)
+        return (blob_storage.save(name, File(encoded, name)), width, height)
@@ -0,0 +1,10 @@
+from django.db import models
+
+
+class MediaBlob(models.Model):
+    # a file stored by media_store.storage.ContentAddressedStorage, and how many fields point at it.
+    # the file (and anything derived from it, see ContentAddressedStorage.delete) is removed when this reaches 0
+    name = models.CharField(max_length=250, unique=True)
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
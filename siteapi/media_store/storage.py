@@ -0,0 +1,181 @@
+import glob
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.utils.deconstruct import deconstructible
+
+from .models import MediaBlob
+
+BLOB_DIRECTORY = 'blobs/'
+BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?P<ext>\.\w+)?$')
+
+
+def hash_file(content):
+    """Returns the sha256 hex digest of a django File, reading it in chunks."""
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_blob_name(digest, ext=''):
+    # fanned out over two levels of directories so none of them gets huge
+    return '%s%s/%s/%s%s' % (BLOB_DIRECTORY, digest[:2], digest[2:4], digest, ext.lower())
+
+
+def get_digest(name):
+    """Returns the digest a blob name was stored under, or None for names that aren't blobs."""
+    match = BLOB_NAME.match(name or '')
+    return match['digest'] if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores files under the sha256 of their content (blobs/ab/cd/abcd....ext) instead of the name they were uploaded
+    with, so uploading the same bytes again costs a lookup rather than another copy. Blobs are reference counted
+    through MediaBlob: every save() takes a reference, every delete() gives one back and the file only goes away
+    with the last one.
+
+    A blob never changes once written, so its URL (and the digest in it) can be cached by clients and proxies
+    indefinitely, e.g. served with `Cache-Control: public, max-age=31536000, immutable`.
+
+    Files that are derived from a blob and named after it (blobs/ab/cd/abcd..._256.webp) are deleted along with it.
+    Names that aren't blobs (files stored before this storage was used) have no references and are deleted right
+    away, like FileSystemStorage would.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        # uploads are hashed as they come in by media_store.upload_handlers
+        digest = getattr(content, 'content_digest', None) or hash_file(content)
+        blob_name = get_blob_name(digest, os.path.splitext(name)[1])
+        self.retain(blob_name, write=lambda: self._write(blob_name, content))
+        return blob_name
+
+    def _write(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # written next to its final name and moved into place, so a blob is never seen half written.
+        # two uploads of the same content racing each other just replace the file with an identical one
+        if hasattr(content, 'temporary_file_path'):
+            file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+        else:
+            fd, temporary_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.replace(temporary_path, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+    def retain(self, name, write=None):
+        """
+        Takes another reference to `name`. The blob's row stays locked from the check of its file to the new
+        reference, so a delete() of the last reference can't remove the file in between.
+
+        If nothing holds the file yet (a new blob, or one whose last reference was just given back) or it is missing,
+        `write` is called to (re)write it first. Without `write` (a file written straight to self.path(name)) the
+        file has to be there already.
+        """
+        with transaction.atomic():
+            blob = None
+            while blob is None:
+                MediaBlob.objects.get_or_create(name=name, defaults={'size': 0})
+                # None if the row was removed with its last reference since get_or_create found it
+                blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if write is not None and (blob.ref_count == 0 or not self.exists(name)):
+                write()
+            blob.size = self.size(name)
+            blob.ref_count += 1
+            blob.save(update_fields=['size', 'ref_count'])
+
+    def delete(self, name):
+        if not name:
+            return
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                # not a blob, nothing else can hold it
+                transaction.on_commit(lambda: self.delete_files(name))
+                return
+            MediaBlob.objects.filter(pk=blob.pk).update(
+                ref_count=models.F('ref_count') - 1)
+            if blob.ref_count <= 1:
+                # the files only go once nothing can roll the row back
+                transaction.on_commit(lambda: self.release(name))
+
+    def release(self, name):
+        # removes a blob whose last reference was given back, unless retain() took a new one in the meantime
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.ref_count > 0:
+                return
+            if blob is not None:
+                blob.delete()
+            self.delete_files(name)
+
+    def delete_files(self, name):
+        super().delete(name)
+        digest = get_digest(name)
+        if digest is not None and MediaBlob.objects.filter(
+                name__startswith=get_blob_name(digest), ref_count__gt=0).exists():
+            # the same content is still stored in another format (the webp a png or gif was converted to), and
+            # the derivatives are named after the digest, not the format
+            return
+        (stem, ext) = os.path.splitext(self.path(name))
+        for path in glob.glob(glob.escape(stem) + '_*'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def manage_blob_fields(model, *field_names):
+    """
+    Gives back the blob references held by `field_names` of `model` when a row is deleted (queryset and cascade
+    deletes included) or a field is pointed at a different file.
+    """
+
+    def get_loaded_names(instance):
+        # deferred fields are left out rather than loaded
+        names = {}
+        for field_name in field_names:
+            if field_name in instance.__dict__:
+                value = instance.__dict__[field_name]
+                names[field_name] = getattr(value, 'name', value)
+        return names
+
+    def remember_names(sender, instance, **kwargs):
+        instance._loaded_blob_names = get_loaded_names(instance)
+
+    def release_replaced(sender, instance, created, **kwargs):
+        # the new name isn't known until the field has saved its file, so this runs after the row is saved
+        if created:
+            return remember_names(sender, instance)
+        for field_name, old_name in getattr(instance, '_loaded_blob_names', {}).items():
+            if old_name and old_name != getattr(instance, field_name).name:
+                blob_storage.delete(old_name)
+        remember_names(sender, instance)
+
+    def release_deleted(sender, instance, **kwargs):
+        for name in get_loaded_names(instance).values():
+            if name:
+                blob_storage.delete(name)
+
+    models.signals.post_init.connect(remember_names, sender=model, weak=False)
+    models.signals.post_save.connect(release_replaced, sender=model, weak=False)
+    models.signals.post_delete.connect(release_deleted, sender=model, weak=False)
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from .models import MediaBlob
+from .storage import ContentAddressedStorage, get_digest
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('goals/images/a.PNG', ContentFile(b'same bytes'))
+        second = self.storage.save('somewhere/else.png', ContentFile(b'same bytes'))
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith('blobs/') and first.endswith('.png'))
+        self.assertIsNotNone(get_digest(first))
+        self.assertEqual(MediaBlob.objects.get(name=first).ref_count, 2)
+
+        other = self.storage.save('a.png', ContentFile(b'other bytes'))
+        self.assertNotEqual(other, first)
+
+    def test_file_goes_with_last_reference(self):
+        name = self.storage.save('a.png', ContentFile(b'bytes'))
+        self.storage.save('b.png', ContentFile(b'bytes'))
+        # a file derived from the blob, like a thumbnail
+        derived = os.path.splitext(self.storage.path(name))[0] + '_256.webp'
+        open(derived, 'wb').close()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(os.path.exists(derived))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_save_racing_the_last_delete(self):
+        name = self.storage.save('a.png', ContentFile(b'bytes'))
+        # the last reference is given back, but its files aren't removed yet
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.storage.delete(name)
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 0)
+        os.remove(self.storage.path(name))
+
+        # the same content again rewrites the file and takes the blob back before the removal runs
+        self.assertEqual(self.storage.save('b.png', ContentFile(b'bytes')), name)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 1)
+
+    def test_names_from_before_are_deleted_right_away(self):
+        os.makedirs(os.path.join(self.location, 'goals/images'))
+        open(os.path.join(self.location, 'goals/images/legacy.png'), 'wb').close()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete('goals/images/legacy.png')
+        self.assertFalse(self.storage.exists('goals/images/legacy.png'))
@@ -0,0 +1,143 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from siteapi.response_cache import bump_generation
+from .models import HourlyPageView, PageView, SiteStatus
+from .rollups import hour_of, upsert_counts
+
+logger = logging.getLogger(__name__)
+
+
+def can_create_site_status(origin):
+    # only our own sites get a site status made for them on first use
+    return "scuzzyfox.com" in str(origin)
+
+
+def add_page_views(origin, pages, batch_size=300):
+    """
+    Adds `pages` ({pathname: amount}) to the view counts of the origin's page views, inserting the pages that don't
+    exist yet, in one upsert per batch (see site_status.rollups.upsert_counts). Relies on the unique
+    (site_status, pathname) constraint, so two processes adding the same new page can't make two rows.
+    """
+    upsert_counts(PageView, ['site_status', 'pathname'],
+                  [(origin, pathname, amount) for pathname, amount in pages.items()], batch_size)
+
+
+def add_hourly_page_views(origin, hours, batch_size=300):
+    # adds `hours` ({(pathname, hour): amount}) to the origin's hourly views. the pages have to exist already
+    pathnames = list({pathname for pathname, hour in hours})
+    page_view_ids = {}
+    for start in range(0, len(pathnames), batch_size):
+        page_view_ids.update(PageView.objects.filter(
+            site_status_id=origin, pathname__in=pathnames[start:start + batch_size]).values_list('pathname', 'id'))
+    upsert_counts(HourlyPageView, ['page_view', 'hour'],
+                  [(page_view_ids[pathname], hour, amount) for (pathname, hour), amount in hours.items()],
+                  batch_size)
+
+
+class PageViewCounter:
+    """
+    Write-behind counter for PageView.view_count and HourlyPageView, like commissions.counters.BufferedCounter but
+    keyed by (origin, pathname, hour) and spread over `shards` independently locked counters, so concurrent beacons for
+    different pages don't all wait on one lock.
+
+    A flush upserts the pending pages of each origin in one statement (see add_page_views), then their hourly
+    views, and adds the total of each origin to SiteStatus.website_views in the same transaction, so website_views stays the sum of its pages
+    without ever being summed again.
+    """
+
+    def __init__(self, flush_interval, shards=8):
+        self.flush_interval = flush_interval
+        self._shards = [(Counter(), threading.Lock()) for i in range(max(1, shards))]
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def increment(self, origin, pathname, when=None, amount=1):
+        key = (origin, pathname, hour_of(when or timezone.now()))
+        (pending, lock) = self._shards[hash(key) % len(self._shards)]
+        with lock:
+            pending[key] += amount
+        if self._thread is None and self.flush_interval:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='page-view-flusher', daemon=True)
+                    self._thread.start()
+
+    def take_pending(self):
+        pending = Counter()
+        for shard, lock in self._shards:
+            with lock:
+                pending.update(shard)
+                shard.clear()
+        return pending
+
+    def give_back(self, pending):
+        for key, amount in pending.items():
+            self.increment(*key, amount=amount)
+
+    def flush(self):
+        pending = self.take_pending()
+        if not pending:
+            return
+        try:
+            self.write(pending)
+        except Exception:
+            # nothing was written, so hand the increments back for the next flush to retry
+            self.give_back(pending)
+            raise
+
+    def write(self, pending):
+        """
+        Writes `pending` ({(origin, pathname, hour): amount}) in one transaction. flush() writes the buffered increments
+        through here, and so does the batched ingest endpoint, whose events are already aggregated by the sender.
+        """
+        by_origin = defaultdict(Counter)
+        hours_by_origin = defaultdict(dict)
+        for (origin, pathname, hour), amount in pending.items():
+            by_origin[origin][pathname] += amount
+            hours_by_origin[origin][(pathname, hour)] = amount
+
+        with transaction.atomic():
+            existing = set(SiteStatus.objects.filter(
+                origin__in=by_origin.keys()).values_list('origin', flat=True))
+            # rows are always written in key order (here, and in upsert_counts) so two workers flushing overlapping
+            # pages lock them in the same order instead of deadlocking
+            missing = sorted(origin for origin in by_origin if origin not in existing)
+            SiteStatus.objects.bulk_create([SiteStatus(origin=origin) for origin in missing
+                                            if can_create_site_status(origin)], ignore_conflicts=True)
+
+            for origin, pages in sorted(by_origin.items()):
+                if origin not in existing and not can_create_site_status(origin):
+                    # the view only queues increments for origins that can have a site status
+                    continue
+                add_page_views(origin, pages)
+                add_hourly_page_views(origin, hours_by_origin[origin])
+                SiteStatus.objects.filter(origin=origin).update(
+                    website_views=models.F('website_views') + sum(pages.values()))
+        bump_generation(PageView)
+        bump_generation(HourlyPageView)
+        bump_generation(SiteStatus)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Could not flush page views")
+            finally:
+                # this thread's connection would otherwise sit open between flushes
+                connection.close()
+
+
+# seconds between flushes. None or 0 disables the background thread, leaving only the flush at exit.
+page_view_counter = PageViewCounter(getattr(settings, 'PAGE_VIEW_FLUSH_INTERVAL', 10),
+                                    getattr(settings, 'PAGE_VIEW_COUNTER_SHARDS', 8))
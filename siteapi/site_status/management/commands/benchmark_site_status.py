@@ -0,0 +1,93 @@
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from site_status.models import PageView, SiteStatus
+from site_status.serializers import PageViewSerializer, SiteStatusSerializer
+from site_status.views import SiteStatusDetail
+
+ORIGIN = 'benchmark.scuzzyfox.com'
+
+
+class Rollback(Exception):
+    pass
+
+
+class LegacySiteStatusSerializer(SiteStatusSerializer):
+    # page views as they used to be serialized, one model instance at a time
+    page_views = PageViewSerializer(many=True, read_only=True)
+
+
+class LegacySiteStatusDetail(APIView):
+    # what SiteStatusDetail.get used to do: sum every page view of the origin and save the total on each request
+    permission_classes = ()
+
+    def get(self, request, origin):
+        site_status = SiteStatus.objects.get(origin=origin)
+        total_web_views = PageView.objects.filter(site_status=site_status).aggregate(
+            sum_views=models.Sum('view_count')).get('sum_views', 0)
+        site_status.website_views = total_web_views if total_web_views is not None else 0
+        site_status.save()
+        return Response(LegacySiteStatusSerializer(site_status).data)
+
+
+class Command(BaseCommand):
+    help = ("Times SiteStatusDetail GETs for an origin with many page views, the old way and the current way. "
+            "Everything it writes is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-views', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def measure(self, view, before_each=None):
+        # the whole request, rendering included
+        timings = []
+        for _ in range(self.repeat):
+            if before_each is not None:
+                before_each()
+            started = time.perf_counter()
+            response = view(self.factory.get('/site-status/%s/' % ORIGIN), origin=ORIGIN)
+            response.render()
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+            cache_key = getattr(response.renderer_context['view'], 'response_cache_key', None)
+            if cache_key is not None:
+                self.cache_keys.add(cache_key)
+        return timings
+
+    def forget_responses(self):
+        # the default cache is shared with the running site (token stamps, generations), so only the responses
+        # cached here are removed
+        cache.delete_many(self.cache_keys)
+
+    def report(self, name, timings):
+        self.stdout.write("%-28s median %8.2f ms   min %8.2f ms   max %8.2f ms" % (
+            name, statistics.median(timings), min(timings), max(timings)))
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        self.factory = APIRequestFactory()
+        view = SiteStatusDetail.as_view()
+        self.cache_keys = set()
+
+        try:
+            with transaction.atomic():
+                site_status = SiteStatus.objects.create(origin=ORIGIN)
+                PageView.objects.bulk_create([PageView(site_status=site_status, pathname='/page/%s' % i,
+                                                       view_count=i % 50) for i in range(options['page_views'])])
+                self.stdout.write("%s page views" % options['page_views'])
+
+                self.report("before (sum + save)", self.measure(LegacySiteStatusDetail.as_view()))
+                # as if every request came right after a flush
+                self.report("after, cache miss", self.measure(view, before_each=self.forget_responses))
+                self.report("after, cache hit", self.measure(view))
+                raise Rollback()
+        except Rollback:
+            pass
+        self.forget_responses()
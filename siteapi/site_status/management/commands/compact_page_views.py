@@ -0,0 +1,36 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from site_status.rollups import compact_hourly_page_views, day_of
+from siteapi.locks import advisory_lock
+
+
+class Command(BaseCommand):
+    help = ("Folds hourly page views older than PAGE_VIEW_HOURLY_RETENTION_DAYS into daily page views. Meant to be "
+            "run on a schedule, e.g. daily from cron, or left running with --loop.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="keep this many days of hourly views instead of PAGE_VIEW_HOURLY_RETENTION_DAYS")
+        parser.add_argument('--loop', action='store_true',
+                            help="keep compacting instead of exiting after one round")
+        parser.add_argument('--interval', type=int, default=3600,
+                            help="seconds between rounds with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            before = None
+            if options['days'] is not None:
+                before = day_of(timezone.now()) - datetime.timedelta(days=options['days'])
+            # any number of compactors can be scheduled, only the one holding the lock does a round
+            with advisory_lock('site_status.compact_page_views') as acquired:
+                if acquired:
+                    compacted = compact_hourly_page_views(before)
+                    if compacted:
+                        self.stdout.write("compacted %s hourly page views" % compacted)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
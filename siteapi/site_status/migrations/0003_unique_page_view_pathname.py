@@ -0,0 +1,31 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+def merge_duplicate_page_views(apps, schema_editor):
+    # concurrent first views of a page could each create a row. keep the oldest one with the sum of all their
+    # counts, so website_views (their total) doesn't change
+    PageView = apps.get_model('site_status', 'PageView')
+    duplicates = (PageView.objects.values('site_status_id', 'pathname')
+                  .annotate(rows=models.Count('id'), first_id=models.Min('id'), total=models.Sum('view_count'))
+                  .filter(rows__gt=1))
+    for duplicate in list(duplicates):
+        PageView.objects.filter(id=duplicate['first_id']).update(view_count=duplicate['total'])
+        PageView.objects.filter(site_status_id=duplicate['site_status_id'], pathname=duplicate['pathname']).exclude(
+            id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_status', '0002_alter_pageview_view_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_page_views, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='pageview',
+            constraint=models.UniqueConstraint(fields=('site_status', 'pathname'), name='unique_page_view_pathname'),
+        ),
+    ]
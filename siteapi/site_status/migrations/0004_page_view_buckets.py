@@ -0,0 +1,48 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('site_status', '0003_unique_page_view_pathname'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyPageView',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('page_view', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_views', to='site_status.pageview')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyPageView',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('page_view', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_views', to='site_status.pageview')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='hourlypageview',
+            index=models.Index(fields=['hour'], name='site_status_hour_051402_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlypageview',
+            constraint=models.UniqueConstraint(fields=('page_view', 'hour'), name='unique_hourly_page_view'),
+        ),
+        migrations.AddIndex(
+            model_name='dailypageview',
+            index=models.Index(fields=['day'], name='site_status_day_cbfc2c_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailypageview',
+            constraint=models.UniqueConstraint(fields=('page_view', 'day'), name='unique_daily_page_view'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.dispatch import receiver
+from siteapi.response_cache import bump_generation
 
 # Create your models here.
 
@@ -47,3 +49,79 @@ class PageView(models.Model):
         SiteStatus, on_delete=models.CASCADE, related_name='page_views')
     pathname = models.CharField(max_length=255)
     view_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # one row per page, so counts can be upserted in place
+            models.UniqueConstraint(
+                fields=['site_status', 'pathname'], name='unique_page_view_pathname'),
+        ]
+
+
+class HourlyPageView(models.Model):
+    """
+    Views of a page during one hour. Written by site_status.counters along with PageView.view_count, and folded
+    into DailyPageView once it's older than PAGE_VIEW_HOURLY_RETENTION_DAYS (see site_status.rollups), so there
+    are never more than pages * 24 * that many days of them, however busy the site gets.
+
+    Attributes:
+    -----------
+    page_view : ForeignKey
+        The page (and through it the origin) these views are of.
+    hour : datetime
+        The start of the hour.
+    view_count : int
+        The views during the hour.
+    """
+    page_view = models.ForeignKey(
+        PageView, on_delete=models.CASCADE, related_name='hourly_views')
+    hour = models.DateTimeField()
+    view_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # also the index for a page's range scans
+            models.UniqueConstraint(
+                fields=['page_view', 'hour'], name='unique_hourly_page_view'),
+        ]
+        indexes = [
+            # range scans over every page of an origin, and compaction
+            models.Index(fields=['hour']),
+        ]
+
+
+class DailyPageView(models.Model):
+    """
+    Views of a page during one day, for days whose hourly views have been compacted.
+
+    Attributes:
+    -----------
+    page_view : ForeignKey
+        The page (and through it the origin) these views are of.
+    day : date
+        The day.
+    view_count : int
+        The views during the day.
+    """
+    page_view = models.ForeignKey(
+        PageView, on_delete=models.CASCADE, related_name='daily_views')
+    day = models.DateField()
+    view_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['page_view', 'day'], name='unique_daily_page_view'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+
+@receiver(models.signals.post_save, sender=SiteStatus)
+@receiver(models.signals.post_delete, sender=SiteStatus)
+@receiver(models.signals.post_save, sender=PageView)
+@receiver(models.signals.post_delete, sender=PageView)
+def bump_site_status_generation(sender, **kwargs):
+    """Makes cached site status responses unreachable when a site status or one of its page views changes."""
+    bump_generation(sender)
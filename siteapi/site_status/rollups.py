@@ -0,0 +1,126 @@
+import datetime
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from siteapi.response_cache import bump_generation
+from .models import DailyPageView, HourlyPageView
+
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
+
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_of(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def upsert_counts(model, key_fields, rows, batch_size=300):
+    """
+    Adds each row's count to the view_count of the `model` row with the row's key (the values of `key_fields`,
+    which have to be unique together), inserting the rows that don't exist yet. `rows` are (*key, count) tuples.
+    One `INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE` per batch, so concurrent writers adding the same new key
+    can't make two rows. Rows are written in key order, so concurrent writers lock the rows they share in the same
+    order and can't deadlock.
+    """
+    rows = sorted(rows, key=lambda row: row[:-1])
+    fields = [model._meta.get_field(name) for name in key_fields] + [model._meta.get_field('view_count')]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = [connection.ops.quote_name(field.column) for field in fields]
+    view_count = columns[-1]
+    if connection.vendor == 'mysql':
+        on_conflict = "ON DUPLICATE KEY UPDATE %s = %s + VALUES(%s)" % (view_count, view_count, view_count)
+    elif connection.features.supports_update_conflicts_with_target:
+        # postgres and sqlite
+        on_conflict = "ON CONFLICT (%s) DO UPDATE SET %s = %s.%s + EXCLUDED.%s" % (
+            ', '.join(columns[:-1]), view_count, table, view_count, view_count)
+    else:
+        for *key, count in rows:
+            lookup = dict(zip(key_fields, key))
+            updated = model.objects.filter(**lookup).update(view_count=models.F('view_count') + count)
+            if not updated:
+                model.objects.create(view_count=count, **lookup)
+        return
+
+    row_placeholder = '(%s)' % ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = []
+            for row in batch:
+                params.extend(field.get_db_prep_value(value, connection) for field, value in zip(fields, row))
+            cursor.execute("INSERT INTO %s (%s) VALUES %s %s" % (
+                table, ', '.join(columns), ', '.join([row_placeholder] * len(batch)), on_conflict), params)
+
+
+def get_hourly_retention():
+    # days of hourly views to keep before folding them into daily views
+    return datetime.timedelta(days=getattr(settings, 'PAGE_VIEW_HOURLY_RETENTION_DAYS', 7))
+
+
+def compact_hourly_page_views(before=None, batch_size=1000):
+    """
+    Folds the hourly views of every hour before `before` (by default midnight PAGE_VIEW_HOURLY_RETENTION_DAYS days
+    ago) into daily views and deletes them. Returns how many hourly rows were folded.
+
+    Each batch locks its hourly rows while it works, so a flush adding to one of them waits, then finds it gone and
+    inserts a new row, which the next compaction picks up. Nothing is counted twice or lost.
+    """
+    if before is None:
+        before = day_of(timezone.now()) - get_hourly_retention()
+    compacted = 0
+    while True:
+        with transaction.atomic():
+            # locked in the same (page_view, hour) order upsert_counts writes them in, so a flush can't deadlock it
+            rows = list(HourlyPageView.objects.select_for_update().filter(hour__lt=before)
+                        .order_by('page_view', 'hour')
+                        .values_list('id', 'page_view_id', 'hour', 'view_count')[:batch_size])
+            if not rows:
+                break
+            days = Counter()
+            for (id, page_view_id, hour, view_count) in rows:
+                days[(page_view_id, hour.date())] += view_count
+            upsert_counts(DailyPageView, ['page_view', 'day'], [(*key, count) for key, count in days.items()])
+            HourlyPageView.objects.filter(id__in=[row[0] for row in rows]).delete()
+        compacted += len(rows)
+    if compacted:
+        bump_generation(HourlyPageView)
+        bump_generation(DailyPageView)
+    return compacted
+
+
+def get_series(origin, interval, start, end, pathname=None):
+    """
+    Returns [(bucket start, views)] of an origin, or of one of its pages, for every hour or day in [start, end)
+    that has views, oldest first. start and end are widened to whole buckets.
+
+    Hours older than the hourly retention have been compacted and are no longer there by the hour. Days are summed
+    from daily views and from hourly views that haven't been compacted yet.
+    """
+    step = HOUR if interval == 'hour' else DAY
+    bucket_of = hour_of if interval == 'hour' else day_of
+    start = bucket_of(start)
+    end = end if bucket_of(end) == end else bucket_of(end) + step
+
+    pages = {'page_view__site_status_id': origin}
+    if pathname is not None:
+        pages['page_view__pathname'] = pathname
+    # a page's views come from the (page_view, hour) unique index, an origin's from the hour index
+    hourly = (HourlyPageView.objects.filter(hour__gte=start, hour__lt=end, **pages)
+              .values_list('hour').annotate(views=models.Sum('view_count')).order_by())
+    if interval == 'hour':
+        return sorted(hourly)
+
+    series = Counter()
+    for hour, views in hourly:
+        series[hour.date()] += views
+    daily = (DailyPageView.objects.filter(day__gte=start.date(), day__lt=end.date(), **pages)
+             .values_list('day').annotate(views=models.Sum('view_count')).order_by())
+    for day, views in daily:
+        series[day] += views
+    return sorted(series.items())
@@ -1,3 +1,5 @@
+import datetime
+
 from .models import PageView, SiteStatus
 from rest_framework import serializers
 
@@ -10,11 +12,12 @@ class PageViewSerializer(serializers.ModelSerializer):
         fields = ('site_origin', 'pathname', 'view_count')
 
     def get_site_origin(self, object):
-        return object.site_status.origin
+        # the origin is the site status' primary key, no need to load it
+        return object.site_status_id
 
 
 class SiteStatusSerializer(serializers.ModelSerializer):
-    page_views = PageViewSerializer(many=True, read_only=True)
+    page_views = serializers.SerializerMethodField()
 
     class Meta:
         model = SiteStatus
@@ -24,3 +27,35 @@ class SiteStatusSerializer(serializers.ModelSerializer):
             # remove unique validator from Origin field
             'origin': {'validators': []},
         }
+
+    def get_page_views(self, object):
+        # the same items PageViewSerializer makes, built straight from the rows. a site has thousands of pages, and
+        # loading them as model instances and running each through a serializer is most of what a (cache missing)
+        # SiteStatusDetail costs
+        if object._state.adding:
+            return []
+        return [{'site_origin': object.origin, 'pathname': pathname, 'view_count': view_count}
+                for pathname, view_count in object.page_views.order_by('id').values_list('pathname', 'view_count')]
+
+
+class PageViewEventSerializer(serializers.Serializer):
+    """One entry of a batch sent to PageViewBatch: `count` views of `pathname`, seen around `ts`."""
+    pathname = serializers.CharField(max_length=255)
+    count = serializers.IntegerField(min_value=1, default=1)
+    ts = serializers.DateTimeField(required=False)
+
+
+class PageViewSeriesQuerySerializer(serializers.Serializer):
+    """The query string of PageViewSeries."""
+    # how far back a series goes without ?start=
+    DEFAULT_RANGES = {'hour': datetime.timedelta(days=2), 'day': datetime.timedelta(days=30)}
+
+    pathname = serializers.CharField(max_length=255, required=False)
+    interval = serializers.ChoiceField(choices=['hour', 'day'], default='day')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] >= data['end']:
+            raise serializers.ValidationError("start has to be before end.")
+        return data
@@ -1,3 +1,198 @@
+import datetime
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from customAuth.models import ScuzzyFoxContentManagerUser
+
+from .counters import add_page_views, page_view_counter
+from .models import DailyPageView, HourlyPageView, PageView, SiteStatus
+
+
+class BufferedPageViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.origin = "scuzzyfox.com"
+        self.url = reverse('page_view_detail', kwargs={'origin': self.origin})
+
+    def test_views_are_buffered_until_flush(self):
+        with self.assertNumQueries(0):
+            for pathname in ["/", "/", "/commissions"]:
+                response = self.client.post(self.url, {'pathname': pathname}, format='json')
+                self.assertEqual(response.status_code, 202)
+        self.assertFalse(PageView.objects.exists())
+
+        page_view_counter.flush()
+        self.assertEqual(dict(PageView.objects.values_list('pathname', 'view_count')), {"/": 2, "/commissions": 1})
+        self.assertEqual(SiteStatus.objects.get(origin=self.origin).website_views, 3)
+
+        # later flushes add to what is there
+        self.client.post(self.url, {'pathname': "/"}, format='json')
+        page_view_counter.flush()
+        self.assertEqual(PageView.objects.get(pathname="/").view_count, 3)
+        self.assertEqual(SiteStatus.objects.get(origin=self.origin).website_views, 4)
+
+    def test_upsert(self):
+        site_status = SiteStatus.objects.create(origin=self.origin)
+        PageView.objects.create(site_status=site_status, pathname="/", view_count=4)
+        pages = {"/": 1, "/a": 2, "/b": 3, "/c": 4, "/d": 5}
+        with self.assertNumQueries(3):
+            add_page_views(self.origin, pages, batch_size=2)
+        pages["/"] = 5
+        self.assertEqual(dict(PageView.objects.values_list('pathname', 'view_count')), pages)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PageView.objects.create(site_status=site_status, pathname="/a")
+
+    def test_unknown_origin(self):
+        response = self.client.post(reverse('page_view_detail', kwargs={'origin': 'example.com'}),
+                                    {'pathname': "/"}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class CachedSiteStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.site_status = SiteStatus.objects.create(origin="scuzzyfox.com", website_views=5)
+        PageView.objects.create(site_status=cls.site_status, pathname="/", view_count=5)
+        cls.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('site_status_detail', kwargs={'origin': "scuzzyfox.com"})
+
+    def test_get_is_a_cached_read(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['website_views'], 5)
+        self.assertEqual(response.data['page_views'], [{'site_origin': "scuzzyfox.com", 'pathname': "/",
+                                                        'view_count': 5}])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).data, response.data)
+
+        # a blank status for our own origins, nothing saved
+        response = self.client.get(reverse('site_status_detail', kwargs={'origin': "new.scuzzyfox.com"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(SiteStatus.objects.filter(origin="new.scuzzyfox.com").exists())
+        response = self.client.get(reverse('site_status_detail', kwargs={'origin': "example.com"}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_flush_and_update_invalidate(self):
+        self.client.get(self.url)
+        page_view_counter.increment("scuzzyfox.com", "/")
+        page_view_counter.flush()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['website_views'], 6)
+        self.assertEqual(response.data['page_views'][0]['view_count'], 6)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.put(reverse('update_site_status', kwargs={'origin': "scuzzyfox.com"}),
+                                   {'commissions_open': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(user=None)
+        self.assertTrue(self.client.get(self.url).data['commissions_open'])
+
+
+class PageViewBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('page_view_batch', kwargs={'origin': "scuzzyfox.com"})
+
+    def test_batch_is_applied_at_once(self):
+        events = [{'pathname': "/", 'count': 3, 'ts': "2026-10-18T10:00:00Z"}, {'pathname': "/commissions"},
+                  {'pathname': "/", 'count': 2}]
+        response = self.client.post(self.url, events, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'site_origin': "scuzzyfox.com", 'pages': 2, 'views': 6})
+        self.assertEqual(dict(PageView.objects.values_list('pathname', 'view_count')), {"/": 5, "/commissions": 1})
+        self.assertEqual(SiteStatus.objects.get(origin="scuzzyfox.com").website_views, 6)
+
+    def test_invalid_batches(self):
+        for events in [[], {'pathname': "/"}, [{'pathname': "/", 'count': 0}], [{'count': 1}]]:
+            response = self.client.post(self.url, events, format='json')
+            self.assertEqual(response.status_code, 400, events)
+        with self.settings(PAGE_VIEW_BATCH_MAX_EVENTS=2):
+            response = self.client.post(self.url, [{'pathname': "/"}] * 3, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(PageView.objects.exists())
+
+        self.client.force_authenticate(user=None)
+        response = self.client.post(self.url, [{'pathname': "/"}], format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+class PageViewRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = ScuzzyFoxContentManagerUser.objects.create_user(
+            username="tester", password="password123", email="tester@scuzzyfox.com")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.series_url = reverse('page_view_series', kwargs={'origin': "scuzzyfox.com"})
+
+    def post_views(self, events):
+        response = self.client.post(reverse('page_view_batch', kwargs={'origin': "scuzzyfox.com"}), events,
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def series(self, **query):
+        response = self.client.get(self.series_url, query)
+        self.assertEqual(response.status_code, 200)
+        return [(bucket['start'], bucket['view_count']) for bucket in response.data['series']]
+
+    def test_views_are_bucketed_and_compacted(self):
+        self.post_views([{'pathname': "/", 'count': 2, 'ts': "2026-01-01T10:15:00"},
+                         {'pathname': "/", 'ts': "2026-01-01T10:45:00"},
+                         {'pathname': "/", 'ts': "2026-01-01T11:00:00"},
+                         {'pathname': "/commissions", 'count': 4, 'ts': "2026-01-02T09:00:00"}])
+        self.assertEqual(HourlyPageView.objects.count(), 3)
+        range_query = {'start': "2026-01-01T00:00:00", 'end': "2026-01-03T00:00:00"}
+        self.assertEqual(self.series(interval='hour', **range_query), [
+            ("2026-01-01T10:00:00+00:00", 3), ("2026-01-01T11:00:00+00:00", 1), ("2026-01-02T09:00:00+00:00", 4)])
+        self.assertEqual(self.series(interval='hour', pathname="/", **range_query), [
+            ("2026-01-01T10:00:00+00:00", 3), ("2026-01-01T11:00:00+00:00", 1)])
+        days = [("2026-01-01", 4), ("2026-01-02", 4)]
+        self.assertEqual(self.series(**range_query), days)
+
+        call_command('compact_page_views', stdout=StringIO())
+        self.assertFalse(HourlyPageView.objects.exists())
+        self.assertEqual(DailyPageView.objects.count(), 2)
+        self.assertEqual(self.series(**range_query), days)
+        self.assertEqual(self.series(interval='hour', **range_query), [])
+
+        # a late view of a compacted day is folded in by the next compaction
+        self.post_views([{'pathname': "/", 'ts': "2026-01-01T23:00:00"}])
+        self.assertEqual(self.series(**range_query), [("2026-01-01", 5), ("2026-01-02", 4)])
+        call_command('compact_page_views', stdout=StringIO())
+        self.assertEqual(DailyPageView.objects.get(day=datetime.date(2026, 1, 1)).view_count, 5)
+        self.assertEqual(PageView.objects.get(pathname="/").view_count, 5)
+
+    def test_recent_views(self):
+        page_view_counter.increment("scuzzyfox.com", "/")
+        page_view_counter.flush()
+        # defaults to the last 30 days
+        self.assertEqual(self.series(), [(timezone.now().date().isoformat(), 1)])
+        call_command('compact_page_views', stdout=StringIO())
+        self.assertTrue(HourlyPageView.objects.exists())
 
-# Create your tests here.
+        response = self.client.get(self.series_url, {'interval': 'week'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('page_view_series', kwargs={'origin': "example.com"}))
+        self.assertEqual(response.status_code, 404)
@@ -3,6 +3,8 @@ from .views import (
     ListSiteStatus,
     SiteStatusDetail,
     PageViewDetail,
+    PageViewBatch,
+    PageViewSeries,
     UpdateSiteStatus,
 )
 
@@ -12,6 +14,10 @@ urlpatterns = [
          SiteStatusDetail.as_view(), name='site_status_detail'),
     path('page-views/<str:origin>/',
          PageViewDetail.as_view(), name='page_view_detail'),
+    path('page-views/<str:origin>/batch/',
+         PageViewBatch.as_view(), name='page_view_batch'),
+    path('page-views/<str:origin>/series/',
+         PageViewSeries.as_view(), name='page_view_series'),
     path('update-site-status/<str:origin>/',
          UpdateSiteStatus.as_view(), name='update_site_status'),
 
@@ -1,49 +1,50 @@
-from rest_framework import generics, mixins, status
-from customAuth.backends import JWTAuthentication
+from collections import Counter
+
+from django.conf import settings
+from rest_framework import generics, mixins, permissions, status
+from customAuth.backends import JWTAuthentication, PermanentTokenAuthentication
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from .models import PageView, SiteStatus
-from .serializers import SiteStatusSerializer, PageViewSerializer
-from django.db import models
+from django.utils import timezone
+from .counters import can_create_site_status, page_view_counter
+from .models import DailyPageView, HourlyPageView, PageView, SiteStatus
+from .rollups import get_series, hour_of
+from .serializers import (SiteStatusSerializer, PageViewSerializer, PageViewEventSerializer,
+                          PageViewSeriesQuerySerializer)
+from siteapi.response_cache import CachedResponseMixin
 
 
-class ListSiteStatus(generics.ListAPIView):
-    """Returns a list of all site statuses"""
+class ListSiteStatus(CachedResponseMixin, generics.ListAPIView):
+    """Returns a list of all site statuses. cached until a site status or page view changes"""
     permission_classes = ()
+    cache_models = [SiteStatus, PageView]
     queryset = SiteStatus.objects.all()
     serializer_class = SiteStatusSerializer
 
 
-class SiteStatusDetail(APIView):
-    """Returns the site status for a specific origin and creates it if it doesn't exist"""
+class SiteStatusDetail(CachedResponseMixin, APIView):
+    """
+    Returns the site status for a specific origin. a pure read: website_views is kept up to date by
+    site_status.counters as page views are flushed, and the response is cached until the flusher or
+    UpdateSiteStatus changes something.
+    """
     permission_classes = ()
+    cache_models = [SiteStatus, PageView]
     serializer_class = SiteStatusSerializer
 
     def get_site_status(self, origin):
-        """Gets the site status object if it exists, else creates a new one"""
-        try:
-            site_status = SiteStatus.objects.get(origin=origin)
-            # calculates total website views based on sum of all page views
-            total_web_views = PageView.objects.filter(site_status=site_status).aggregate(
-                sum_views=models.Sum('view_count')).get('sum_views', 0)
-            site_status.website_views = total_web_views if total_web_views is not None else 0
-            site_status.save()
-            return site_status
-        except SiteStatus.DoesNotExist:
-            if "scuzzyfox.com" in str(origin):
-                site_status = SiteStatus(origin=origin)
-                site_status.save()
-                # calculates total website views based on sum of all page views
-                total_web_views = PageView.objects.filter(site_status=site_status).aggregate(
-                    sum_views=models.Sum('view_count')).get('sum_views', 0)
-                site_status.website_views = total_web_views if total_web_views is not None else 0
-                site_status.save()
-                return site_status
+        """Gets the site status, or an unsaved blank one for our own origins that don't have one yet"""
+        site_status = SiteStatus.objects.filter(origin=origin).first()
+        if site_status is None and can_create_site_status(origin):
+            # created by the first page view or status update rather than by a read
+            site_status = SiteStatus(origin=origin)
+        return site_status
 
     def get(self, request, origin):
-
         site_status = self.get_site_status(origin=origin)
+        if site_status is None:
+            return Response({"error": "Site status not found."}, status=status.HTTP_404_NOT_FOUND)
         serializer = self.serializer_class(site_status)
         return Response(serializer.data)
 
@@ -52,7 +53,7 @@ class PageViewDetail(APIView):
     """
     Get: returns a specific page view or creates it if it doesn't exist. does not increment.
 
-    Post: increments a specific page view or creates it and increments it if it doesn't exist. returns the page view
+    Post: queues an increment of a specific page view, which is created on the next flush if it doesn't exist.
     """
     permission_classes = ()
     lookup_fields = ["origin", "pathname"]
@@ -60,33 +61,16 @@ class PageViewDetail(APIView):
     serializer_class = PageViewSerializer
 
     def get_or_make_page_view(self, origin, pathname):
-        try:
-            site_status = SiteStatus.objects.get(origin=origin)
-        except SiteStatus.DoesNotExist:
-            if "scuzzyfox.com" in str(origin):
-                site_status = SiteStatus(origin=origin)
-                site_status.save()
-        try:
-            page_view = PageView.objects.get(
-                site_status=site_status, pathname=pathname)
-        except PageView.DoesNotExist:
-            page_view = PageView(site_status=site_status, pathname=pathname)
-            page_view.save()
-
+        """Gets the page view, creating it (and our own origins' site status) if it doesn't exist"""
+        if can_create_site_status(origin):
+            site_status, created = SiteStatus.objects.get_or_create(origin=origin)
+        else:
+            site_status = get_object_or_404(SiteStatus, origin=origin)
+        # the unique (site_status, pathname) constraint makes a concurrent create fail, and get_or_create then
+        # returns the row the other request made
+        page_view, created = PageView.objects.get_or_create(site_status=site_status, pathname=pathname)
         return page_view
 
-    def update_website_views(self, origin):
-        try:
-            site_status = SiteStatus.objects.get(origin=origin)
-        except SiteStatus.DoesNotExist:
-            if "scuzzyfox.com" in str(origin):
-                site_status = SiteStatus(origin=origin)
-                site_status.save()
-        total_web_views = PageView.objects.filter(site_status=site_status).aggregate(
-            sum_views=models.Sum('view_count')).get('sum_views', 0)
-        site_status.website_views = total_web_views if total_web_views is not None else 0
-        site_status.save()
-
     def get(self, request, origin):
         pathname = request.data.get("pathname")
         if pathname is None:
@@ -102,24 +86,83 @@ class PageViewDetail(APIView):
         if pathname is None:
             return Response({"error": "No pathname supplied"}, status=status.HTTP_400_BAD_REQUEST)
 
-        page_view = self.get_or_make_page_view(
-            origin=origin, pathname=pathname)
+        # the increment is buffered and written in batches by site_status.counters, which also keeps the site's
+        # website_views up to date, so just acknowledge it
+        if not can_create_site_status(origin) and not SiteStatus.objects.filter(origin=origin).exists():
+            return Response({"error": "Site status not found."}, status=status.HTTP_404_NOT_FOUND)
+        page_view_counter.increment(origin, pathname)
+        return Response({"site_origin": origin, "pathname": pathname, "queued": True},
+                        status=status.HTTP_202_ACCEPTED)
 
-        page_view.view_count = page_view.view_count + 1
-        page_view.save()
-        self.update_website_views(origin=origin)
-        serializer = self.serializer_class(page_view)
-        return Response(serializer.data)
+
+class PageViewBatch(APIView):
+    """
+    Post: applies an array of {pathname, count, ts} events for an origin at once, for a sender (the edge server)
+    that aggregates beacons for a while instead of forwarding each one. unlike PageViewDetail.post nothing is
+    buffered: the counts are written in one transaction, with one upsert for all the pages, before responding.
+    """
+    authentication_classes = [JWTAuthentication, PermanentTokenAuthentication]
+    # counts are taken as given, so only trusted senders
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, origin):
+        if not can_create_site_status(origin) and not SiteStatus.objects.filter(origin=origin).exists():
+            return Response({"error": "Site status not found."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = PageViewEventSerializer(data=request.data, many=True, allow_empty=False,
+                                             max_length=getattr(settings, 'PAGE_VIEW_BATCH_MAX_EVENTS', 1000))
+        serializer.is_valid(raise_exception=True)
+
+        now = timezone.now()
+        pending = Counter()
+        for event in serializer.validated_data:
+            # the sender's clock decides the hour, but views can't be counted in the future
+            hour = hour_of(min(event.get('ts', now), now))
+            pending[(origin, event['pathname'], hour)] += event['count']
+        page_view_counter.write(pending)
+        return Response({"site_origin": origin, "pages": len({pathname for (origin, pathname, hour) in pending}),
+                         "views": sum(pending.values())})
+
+
+class PageViewSeries(CachedResponseMixin, APIView):
+    """
+    Returns the views of an origin, or of one of its pages (?pathname=), per hour or per day (?interval=hour|day)
+    between ?start= and ?end=. only buckets with views are listed. hours are only kept for
+    PAGE_VIEW_HOURLY_RETENTION_DAYS, see site_status.rollups.
+    """
+    permission_classes = ()
+    cache_models = [PageView, HourlyPageView, DailyPageView]
+
+    def get(self, request, origin):
+        if not can_create_site_status(origin) and not SiteStatus.objects.filter(origin=origin).exists():
+            return Response({"error": "Site status not found."}, status=status.HTTP_404_NOT_FOUND)
+        query = PageViewSeriesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        interval = query.validated_data['interval']
+        end = query.validated_data.get('end') or timezone.now()
+        start = query.validated_data.get('start') or end - PageViewSeriesQuerySerializer.DEFAULT_RANGES[interval]
+        pathname = query.validated_data.get('pathname')
+
+        series = get_series(origin, interval, start, end, pathname=pathname)
+        return Response({
+            "site_origin": origin,
+            "pathname": pathname,
+            "interval": interval,
+            "series": [{"start": bucket.isoformat(), "view_count": views} for bucket, views in series],
+        })
 
 
 class UpdateSiteStatus(APIView):
-    """Updates the site status for a specific origin. site status has to exist."""
+    """Updates the site status for a specific origin. site status has to exist, unless it's one of our own origins."""
     authentication_classes = [JWTAuthentication]
     serializer_class = SiteStatusSerializer
 
     def put(self, request, origin):
         """Updates the site status for a specific origin"""
-        site_status = get_object_or_404(SiteStatus, origin=origin)
+        if can_create_site_status(origin):
+            site_status, created = SiteStatus.objects.get_or_create(origin=origin)
+        else:
+            site_status = get_object_or_404(SiteStatus, origin=origin)
+        # saving bumps the SiteStatus generation, which invalidates the cached SiteStatusDetail responses
         site_status.commissions_open = request.data.get(
             "commissions_open", site_status.commissions_open)
         site_status.requests_open = request.data.get(
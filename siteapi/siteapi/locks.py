@@ -0,0 +1,39 @@
+import contextlib
+import hashlib
+
+from django.db import connection
+
+
+@contextlib.contextmanager
+def advisory_lock(name):
+    """
+    Tries to take the database-wide advisory lock `name` without waiting and yields whether it got it. Periodic jobs
+    that run in several processes use it to elect one of them to do the work each round.
+
+    MySQL and PostgreSQL have advisory locks. Other databases (sqlite in development) have no other processes to
+    compete with, so the lock is always granted there.
+    """
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", [name])
+            acquired = cursor.fetchone()[0] == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", [name])
+    elif connection.vendor == 'postgresql':
+        # postgres locks are keyed by a bigint
+        key = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [key])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", [key])
+    else:
+        yield True
@@ -0,0 +1,156 @@
+import datetime
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+from rest_framework import status
+from rest_framework.response import Response
+
+# how long a cached response may live. entries normally become unreachable long before this, as soon as one of
+# the models they were built from changes generation.
+RESPONSE_CACHE_TIMEOUT = getattr(
+    settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def get_generation_key(model):
+    return 'generation:%s' % model._meta.label_lower
+
+
+def get_generations(models):
+    """
+    Returns the current generation of every model in `models`.
+
+    A generation that isn't in the cache (first use or evicted) starts at the current time in nanoseconds rather
+    than at 0, so that it can never line up with a generation some old cache entry was keyed on.
+    """
+    keys = [get_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(model):
+    """
+    Makes every cached response built from `model` unreachable.
+
+    Called from signal receivers, i.e. before the writer's transaction commits, so it bumps twice: right away, and
+    again once the transaction commits. A GET that runs in between still reads the old rows, and without the second
+    bump would cache them under the new generation until the next write.
+
+    The new generation is simply the current time in nanoseconds, so a generation doubles as the time the model last
+    changed. There is no read-modify-write, which FileBasedCache couldn't do atomically across workers anyway.
+    """
+    key = get_generation_key(model)
+    cache.set(key, time.time_ns(), None)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+class CachedResponseMixin:
+    """
+    Caches successful GET responses, keyed by path, query string, the class that authenticated the request and
+    the current generation of every model in `cache_models`.
+
+    Each model in `cache_models` needs its post_save/post_delete (and m2m_changed, for its many to many fields)
+    signals hooked up to bump_generation(), otherwise its changes won't invalidate anything.
+    """
+    cache_models = []
+
+    def get_response_cache_key(self, request):
+        authenticator = getattr(request, 'successful_authenticator', None)
+        auth_class = authenticator.__class__.__name__ if authenticator is not None else 'anonymous'
+        generations = get_generations(self.cache_models)
+        raw_key = '%s:%s:%s:%s' % (':'.join(str(generation) for generation in generations),
+                                   auth_class, request.path, request.META.get('QUERY_STRING', ''))
+        return 'response:%s' % hashlib.sha256(raw_key.encode()).hexdigest()
+
+    def dispatch(self, request, *args, **kwargs):
+        # same as APIView.dispatch, except that the handler is skipped on a cache hit.
+        # authentication has to run first because the key depends on which class authenticated the request.
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(),
+                                  self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if request.method == 'GET':
+                cache_key = self.response_cache_key = self.get_response_cache_key(request)
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    response = Response(cached)
+                else:
+                    response = handler(request, *args, **kwargs)
+                    if response.status_code == status.HTTP_200_OK:
+                        cache.set(cache_key, response.data,
+                                  RESPONSE_CACHE_TIMEOUT)
+            else:
+                response = handler(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs)
+        return self.response
+
+
+def conditional_get(model, modified_fields=('modified',), related_models=()):
+    """
+    Returns a `condition` decorator for a view's dispatch that answers GETs carrying If-None-Match or
+    If-Modified-Since with a 304 before anything is serialized, and adds ETag and Last-Modified to the rest.
+
+    Both validators come from one aggregate over the rows matching the URL kwargs (the whole table for list views,
+    which is conservative but never wrong): the row count and the latest of `modified_fields`. The generations of
+    `model` and `related_models` are folded in as well, since edits to related rows and many to many fields don't
+    touch the model's own timestamps.
+    """
+    generation_models = [model, *related_models]
+
+    def get_validators(request, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return (None, None)
+        # etag_func and last_modified_func are called separately, only aggregate once
+        if not hasattr(request, '_conditional_validators'):
+            summary = model.objects.filter(**kwargs).aggregate(
+                row_count=Count('pk'), **{'latest_' + field: Max(field) for field in modified_fields})
+            generations = get_generations(generation_models)
+
+            timestamps = [max(generations) / 1e9]
+            timestamps += [summary['latest_' + field].timestamp() for field in modified_fields
+                           if summary['latest_' + field] is not None]
+            # http dates have no sub-second part. a change later in the same second still changes the etag,
+            # and If-None-Match takes precedence over If-Modified-Since.
+            last_modified = datetime.datetime.fromtimestamp(
+                math.ceil(max(timestamps)), tz=datetime.timezone.utc)
+
+            raw_etag = '%s:%s:%s:%s:%s:%s' % (summary['row_count'], last_modified.isoformat(),
+                                              ':'.join(str(generation) for generation in generations),
+                                              request.get_full_path(), request.META.get('HTTP_ACCEPT', ''),
+                                              request.META.get('HTTP_AUTHORIZATION', ''))
+            etag = '"%s"' % hashlib.sha256(raw_etag.encode()).hexdigest()
+            request._conditional_validators = (etag, last_modified)
+        return request._conditional_validators
+
+    def etag(request, *args, **kwargs):
+        return get_validators(request, **kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return get_validators(request, **kwargs)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -1,4 +1,5 @@
 from pathlib import Path
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,6 +20,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'customAuth',
+    'media_store',
     'goals',
     'corsheaders',
     'site_status',
@@ -113,6 +115,22 @@ REST_FRAMEWORK = {
     )
 }
 
+# shared between gunicorn workers so that a cache invalidation in one worker is seen by all of them.
+# (the default local memory cache is per process). good enough for development, production uses redis, see
+# settings_prod
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(Path(tempfile.gettempdir()) / 'siteapi-cache'),
+    }
+}
+
+# uploads are hashed as they are received, media_store.storage.ContentAddressedStorage stores them by that digest
+FILE_UPLOAD_HANDLERS = [
+    'media_store.upload_handlers.HashingMemoryFileUploadHandler',
+    'media_store.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
 AUTHENTICATION_BACKENDS = [
     'customAuth.backends.UsernameBackend',
     'django.contrib.auth.backends.ModelBackend'